@@ -0,0 +1 @@
+'''Benchmarks of wunderpy against a local mock server, see run.py.'''
@@ -0,0 +1,246 @@
+'''Run the benchmarks and save the results as JSON.
+
+    python -m benchmarks.run --tasks 5000 --output results.json
+    python -m benchmarks.run --compare results.json
+
+Everything runs against benchmarks.server, so the numbers measure
+wunderpy rather than the network. Each benchmark is repeated and the
+min, median, mean and 95th percentile times (in seconds) are kept.
+'''
+
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import wunderpy
+from wunderpy import Wunderlist, api
+
+from .server import Account, make_account, serving
+
+
+def measure(func, repeat):
+    '''Call func repeat times, return statistics of how long it took.'''
+
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        func()
+        times.append(time.time() - started)
+    times.sort()
+    return {"repeat": repeat,
+            "min": times[0],
+            "median": times[len(times) // 2],
+            "mean": sum(times) / len(times),
+            "p95": times[min(len(times) - 1, int(len(times) * 0.95))]}
+
+
+def make_client():
+    wunderlist = Wunderlist()
+    wunderlist.set_token("benchmark")
+    return wunderlist
+
+
+def bench_update_lists(server, options):
+    wunderlist = make_client()
+    return measure(wunderlist.update_lists, options.repeat)
+
+
+def bench_batch_throughput(server, options):
+    '''Send options.ops title changes through send_requests.'''
+
+    wunderlist = make_client()
+    task_ids = server.account.tasks[:options.ops]
+    results = {}
+    for sequential in (True, False):
+        def send():
+            requests = [api.calls.set_title_for_task(task_id, "renamed")
+                        for task_id in task_ids]
+            for _ in wunderlist.send_requests(requests,
+                                              sequential=sequential):
+                pass
+        stats = measure(send, options.repeat)
+        stats["ops_per_second"] = len(task_ids) / stats["median"]
+        results["sequential" if sequential else "parallel"] = stats
+    return results
+
+
+def bench_single_request(server, options):
+    wunderlist = make_client()
+    return measure(lambda: wunderlist.send_request(api.calls.me()),
+                   options.repeat * 10)
+
+
+def bench_queries(server, options):
+    wunderlist = make_client()
+    wunderlist.update_lists()
+    week = date.today() + timedelta(days=7)
+    step = max(1, options.tasks // 100)
+    titles = ["task {}".format(n) for n in range(0, options.tasks, step)]
+
+    def with_title():
+        for task_list in wunderlist.lists:
+            for title in titles:
+                task_list.task_with_title(title)
+
+    return {
+        "tasks_due_before": measure(
+            lambda: wunderlist.tasks_due_before(week), options.repeat * 10),
+        "task_with_title": measure(with_title, options.repeat * 10),
+        "find_tasks": measure(
+            lambda: wunderlist.find_tasks(due_before=week, completed=False),
+            options.repeat * 10),
+    }
+
+
+def bench_iter_tasks(server, options):
+    '''Stream every task, in one response and in pages of 500.'''
+
+    wunderlist = make_client()
+
+    def stream(per_page):
+        for _ in wunderlist.iter_tasks(per_page):
+            pass
+    return {"single": measure(lambda: stream(None), options.repeat),
+            "paged": measure(lambda: stream(500), options.repeat)}
+
+
+CLI_SCRIPT = '''
+import sys
+import wunderpy.api.calls
+wunderpy.api.calls.API_URL = sys.argv[1]
+sys.argv = ["wunderlist"] + sys.argv[2:]
+from wunderpy.cli.main import main
+main()
+'''
+
+
+def bench_cli_startup(server, options):
+    '''Run the CLI's --today in a new process, from the snapshot and not.'''
+
+    home = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, HOME=home)
+        with open(os.path.join(home, ".wunderpyrc"), "w") as config:
+            json.dump({"token": "benchmark", "cache_ttl": 10 ** 9}, config)
+
+        def run(*args):
+            with open(os.devnull, "w") as devnull:
+                subprocess.check_call([sys.executable, "-c", CLI_SCRIPT,
+                                       server.url, "--today"] + list(args),
+                                      env=env, stdout=devnull)
+
+        run("--refresh")  # writes the snapshot
+        return {"snapshot": measure(run, options.repeat),
+                "refresh": measure(lambda: run("--refresh"),
+                                   options.repeat)}
+    finally:
+        shutil.rmtree(home)
+
+
+BENCHMARKS = [("update_lists", bench_update_lists),
+              ("batch_throughput", bench_batch_throughput),
+              ("single_request", bench_single_request),
+              ("queries", bench_queries),
+              ("iter_tasks", bench_iter_tasks),
+              ("cli_startup", bench_cli_startup)]
+
+
+def run(options):
+    '''Run the selected benchmarks, return the results as a dict.'''
+
+    tasks, lists = make_account(options.lists, options.tasks, options.seed)
+    results = {}
+    for name, bench in BENCHMARKS:
+        if options.only and name not in options.only:
+            continue
+        with serving(Account(tasks, lists), options.latency) as server:
+            results[name] = bench(server, options)
+        sys.stderr.write("{}: done\n".format(name))
+
+    return {"wunderpy": wunderpy.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "codec": api.APIClient(codec=None).codec.name,
+            "time": time.time(),
+            "options": {"lists": options.lists, "tasks": options.tasks,
+                        "ops": options.ops, "repeat": options.repeat,
+                        "latency": options.latency, "seed": options.seed},
+            "results": results}
+
+
+def medians(results, prefix=""):
+    '''Flatten results to {"name.sub": median seconds}.'''
+
+    flat = {}
+    for name, value in results.items():
+        if "median" in value:
+            flat[prefix + name] = value["median"]
+        else:
+            flat.update(medians(value, prefix + name + "."))
+    return flat
+
+
+def compare(baseline, current):
+    '''Print each median next to the baseline's, slower ones marked.'''
+
+    before = medians(baseline["results"])
+    after = medians(current["results"])
+    print("{:40} {:>12} {:>12} {:>8}".format("benchmark", "baseline",
+                                             "current", "ratio"))
+    for name in sorted(after):
+        if name not in before:
+            continue
+        ratio = after[name] / before[name] if before[name] else 0.0
+        print("{:40} {:12.6f} {:12.6f} {:7.2f}x{}".format(
+            name, before[name], after[name], ratio,
+            " slower" if ratio > 1.1 else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wunderpy "
+                                     "against a local mock server.")
+    parser.add_argument("--lists", type=int, default=20,
+                        help="Lists in the account. [default 20]")
+    parser.add_argument("--tasks", type=int, default=5000,
+                        help="Tasks in the account. [default 5000]")
+    parser.add_argument("--ops", type=int, default=500,
+                        help="Ops per batch throughput run. [default 500]")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of each benchmark, quick ones are run "
+                        "ten times more. [default 5]")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the server waits before answering.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the synthetic account.")
+    parser.add_argument("--only", action="append",
+                        choices=[name for name, bench in BENCHMARKS],
+                        help="Only run this benchmark, may be repeated.")
+    parser.add_argument("-o", "--output",
+                        help="Write the results to this JSON file.")
+    parser.add_argument("--compare",
+                        help="Compare with results saved by an earlier run.")
+    options = parser.parse_args()
+
+    current = run(options)
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(current, output, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        print("")
+    if options.compare:
+        with open(options.compare) as baseline:
+            compare(json.load(baseline), current)
+
+
+if __name__ == "__main__":
+    main()
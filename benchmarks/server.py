@@ -0,0 +1,224 @@
+'''A local stand-in for the Wunderlist API, serving a synthetic account.
+
+It answers the calls wunderpy makes (/me, /me/tasks with or without
+paging, /me/lists, /batch, creating, updating and deleting tasks and
+lists) from memory, with ETags on GETs, so the client can be measured
+without the network.
+'''
+
+
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+import wunderpy.api.calls
+
+
+def make_account(lists=10, tasks=1000, seed=0):
+    '''Make the list and task dicts of a synthetic account.
+
+    Tasks are spread over the inbox and the lists, about a third have no
+    due date and the rest are due within two months either side of today.
+
+    :param lists: Number of lists besides the inbox.
+    :type lists: int
+    :param tasks: Number of tasks.
+    :type tasks: int
+    :param seed: Seed for the random data, same seed same account.
+    :type seed: int
+    :returns: tuple -- (task dicts, list dicts)
+    '''
+
+    rng = random.Random(seed)
+    today = date.today()
+    list_dicts = [{"id": "l{}".format(n), "title": "list {}".format(n),
+                   "updated_at": "2014-01-01T00:00:00Z"}
+                  for n in range(lists)]
+    list_ids = ["inbox"] + [l["id"] for l in list_dicts]
+
+    task_dicts = []
+    for n in range(tasks):
+        task = {"id": "t{}".format(n), "title": "task {}".format(n),
+                "list_id": rng.choice(list_ids),
+                "starred": rng.random() < 0.1,
+                "updated_at": "2014-01-01T00:00:00Z"}
+        if rng.random() < 0.66:
+            due = today + timedelta(days=rng.randint(-60, 60))
+            task["due_date"] = due.isoformat()
+        if rng.random() < 0.3:
+            task["completed_at"] = "2014-01-01T00:00:00Z"
+        task_dicts.append(task)
+    return task_dicts, list_dicts
+
+
+class Account(object):
+    '''The state of the account a MockServer serves.'''
+
+    def __init__(self, tasks, lists):
+        self.objects = {}
+        self.tasks = []  # ids, in order
+        self.lists = []
+        for task in tasks:
+            self.objects[task["id"]] = dict(task)
+            self.tasks.append(task["id"])
+        for task_list in lists:
+            self.objects[task_list["id"]] = dict(task_list)
+            self.lists.append(task_list["id"])
+        self.revision = 0
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def handle(self, method, path, params):
+        '''Run one call, returning (status, body).
+
+        GET /me/tasks takes page and per_page query parameters.
+        '''
+
+        path, query = urlsplit(path)[2:4]
+        query = parse_qs(query)
+        with self.lock:
+            if path == "/me":
+                return 200, {"id": "user", "name": "benchmark"}
+            if path == "/me/tasks" and method == "GET":
+                task_ids = self.tasks
+                if "per_page" in query:
+                    per_page = int(query["per_page"][0])
+                    start = (int(query.get("page", ["1"])[0]) - 1) * per_page
+                    task_ids = task_ids[start:start + per_page]
+                return 200, [self.objects[i] for i in task_ids]
+            if path == "/me/lists" and method == "GET":
+                return 200, [self.objects[i] for i in self.lists]
+            if path in ("/me/tasks", "/me/lists") and method == "POST":
+                self.created += 1
+                self.revision += 1
+                kind = "t" if path == "/me/tasks" else "l"
+                object_id = "new{}{}".format(kind, self.created)
+                self.objects[object_id] = dict(params or {}, id=object_id)
+                (self.tasks if kind == "t" else self.lists).append(object_id)
+                return 201, self.objects[object_id]
+
+            object_id = path.strip("/")
+            if object_id not in self.objects:
+                return 404, {"error": "not found"}
+            self.revision += 1
+            if method == "PUT":
+                self.objects[object_id].update(params or {})
+                return 200, self.objects[object_id]
+            if method == "DELETE":
+                del self.objects[object_id]
+                for ids in (self.tasks, self.lists):
+                    if object_id in ids:
+                        ids.remove(object_id)
+                return 200, {}
+            return 405, {"error": "method not allowed"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        params = json.loads(self.rfile.read(length).decode("utf-8")
+                            if length else "{}")
+        account = server.account
+
+        if self.path == "/batch" and self.command == "POST":
+            results = []
+            for op in params["ops"]:
+                status, body = account.handle(op["method"], op["url"],
+                                              op.get("params"))
+                results.append({"status": status, "body": body})
+            return self._respond(200, {"results": results})
+
+        if self.command == "GET":
+            etag = '"{}"'.format(account.revision)
+            if self.headers.get("If-None-Match") == etag:
+                return self._respond(304, None, {"ETag": etag})
+            status, body = account.handle("GET", self.path, None)
+            return self._respond(status, body, {"ETag": etag})
+
+        status, body = account.handle(self.command, self.path, params)
+        self._respond(status, body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    '''Serves an Account on localhost from a background thread.'''
+
+    daemon_threads = True
+
+    def __init__(self, account, latency=0.0, port=0):
+        '''
+        :param account: What to serve.
+        :type account: Account
+        :param latency: Seconds to wait before answering each request.
+        :type latency: float
+        :param port: Port to listen on, 0 picks a free one.
+        :type port: int
+        '''
+
+        HTTPServer.__init__(self, ("127.0.0.1", port), Handler)
+        self.account = account
+        self.latency = latency
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@contextmanager
+def serving(account, latency=0.0):
+    '''Run a MockServer and point wunderpy at it while in the block.
+
+    :yields: MockServer
+    '''
+
+    server = MockServer(account, latency)
+    server.start()
+    api_url = wunderpy.api.calls.API_URL
+    wunderpy.api.calls.API_URL = server.url
+    try:
+        yield server
+    finally:
+        wunderpy.api.calls.API_URL = api_url
+        server.stop()
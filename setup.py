@@ -28,7 +28,8 @@ setup(
                 'Topic :: Utilities',
                 'Topic :: Documentation',
                 'Environment :: Console'],
-    packages=find_packages(exclude=("tests",)),
-    install_requires=["requests>=2.0.0", "python-dateutil==2.2"],
+    packages=find_packages(exclude=("tests", "benchmarks")),
+    install_requires=["requests>=2.9.0", "python-dateutil==2.2"],
+    extras_require={"async": ["aiohttp>=3.0"], "orjson": ["orjson"]},
     entry_points={'console_scripts': ['wunderlist = wunderpy.cli.main:main']}
 )
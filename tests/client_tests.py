@@ -1,9 +1,34 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 from datetime import date, datetime, timedelta
 
+import dateutil.parser
+from requests import Response
+
 from wunderpy import Wunderlist
+from wunderpy import api
+from wunderpy.api import codec
+from wunderpy.api.metrics import RequestEvent, endpoint
+from wunderpy.api.stream import iter_array
+from wunderpy.wunderlist.wunderlist import group_tasks
+from wunderpy.wunderlist import query, Refresher
 from wunderpy.wunderlist.task_list import TaskList
-from wunderpy.wunderlist.task import Task
+from wunderpy.wunderlist.index import Index
+from wunderpy.wunderlist.task import Task, parse_datetime
+from wunderpy.cli import storage
+
+try:  # python 3 with aiohttp
+    import asyncio
+    from wunderpy.api.async_client import AsyncAPIClient
+    from wunderpy.wunderlist.async_wunderlist import AsyncWunderlist
+    from wunderpy.wunderlist.async_wunderlist import AsyncRefresher
+except (ImportError, SyntaxError):
+    AsyncAPIClient = None
 
 
 class TestClient(unittest.TestCase):
@@ -70,7 +95,7 @@ class TestClient(unittest.TestCase):
         self.assertEqual(self.wl.tasks_due_before(date.today()), [task_one])
         self.assertEqual(self.wl.tasks_due_before(date.today() +
                                                   timedelta(days=2)),
-                         [task_one, task_two, task_three])
+                         [task_three, task_one, task_two])
 
     def test_due_on(self):
         one = TaskList({"title": "one", "id": "one"})
@@ -96,6 +121,385 @@ class TestClient(unittest.TestCase):
                                               timedelta(days=1)),
                          [task_three])
 
+    def test_update_lists(self):
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox"},
+                 {"title": "b", "id": "b", "list_id": "one"},
+                 {"title": "c", "id": "c", "list_id": "gone"}]
+        lists = [{"title": "one", "id": "one"}]
+        self.wl.send_requests = lambda requests: iter([tasks, lists])
+        self.wl.update_lists()
+
+        self.assertEqual([l.id for l in self.wl.lists], ["inbox", "one"])
+        self.assertEqual(self.wl.get_task("a", "inbox").id, "a")
+        self.assertEqual(self.wl.get_task("b", "one").id, "b")
+        self.assertEqual([t.id for t in self.wl.orphans.tasks], ["c"])
+        self.assertIs(self.wl.orphans.tasks[0].parent_list, self.wl.orphans)
+
+    def test_sync(self):
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox"},
+                 {"title": "b", "id": "b", "list_id": "one"},
+                 {"title": "c", "id": "c", "list_id": "one"}]
+        lists = [{"title": "one", "id": "one"}, {"title": "two", "id": "two"}]
+        self.wl.send_requests = lambda requests: iter([tasks, lists])
+        self.wl.update_lists()
+        inbox = self.wl.list_with_title("inbox")
+        task_a = self.wl.get_task("a", "inbox")
+        task_b = self.wl.get_task("b", "one")
+
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox"},
+                 {"title": "b", "id": "b", "list_id": "inbox"},
+                 {"title": "d", "id": "d", "list_id": "one"}]
+        lists = [{"title": "one", "id": "one"}]
+        self.wl.send_requests = lambda requests: iter([tasks, lists])
+        changed_lists, changed_tasks = self.wl.sync()
+
+        self.assertEqual([l.title for l in changed_lists], ["two"])
+        self.assertEqual(sorted(t.id for t in changed_tasks),
+                         ["b", "c", "d"])
+        self.assertIs(self.wl.list_with_title("inbox"), inbox)
+        self.assertIs(self.wl.get_task("a", "inbox"), task_a)
+        self.assertIs(self.wl.get_task("b", "inbox"), task_b)
+        self.assertIs(task_b.parent_list, inbox)
+        self.assertEqual([t.id for t in self.wl.tasks_for_list("one")], ["d"])
+        self.assertIsNone(self.wl.list_with_title("two"))
+        self.assertIs(self.wl.task_with_id("b"), task_b)
+        self.assertIsNone(self.wl.task_with_id("c"))
+
+    def test_lazy_update_lists(self):
+        lists = [{"title": "one", "id": "one"}, {"title": "two", "id": "two"}]
+        tasks = {"inbox": [{"title": "a", "id": "a", "list_id": "inbox"}],
+                 "one": [{"title": "b", "id": "b", "list_id": "one"}],
+                 "two": [{"title": "c", "id": "c", "list_id": "two"}]}
+        sent = []
+
+        def send_request(request):
+            sent.append(request.path)
+            if request.path == "/me/lists":
+                return lists
+            return tasks[request.path.split("/")[1]]
+
+        def send_requests(requests, sequential=True):
+            sent.append([r.path for r in requests])
+            return iter([tasks[r.path.split("/")[1]] for r in requests])
+
+        self.wl.send_request = send_request
+        self.wl.send_requests = send_requests
+        self.wl.update_lists(lazy=True, prefetch=["one"])
+        self.assertEqual(sent, ["/me/lists", ["/one/tasks"]])
+
+        inbox, one, two = self.wl.lists
+        self.assertTrue(one.loaded)
+        self.assertFalse(two.loaded)
+        self.assertEqual([t.id for t in one.tasks], ["b"])
+        self.assertEqual(self.wl.get_task("c", "two").id, "c")
+        self.assertIs(two.tasks[0].parent_list, two)
+        self.assertEqual(sent[-1], "/two/tasks")
+
+        # /me/tasks fills in the lists that were never loaded
+        self.wl.send_requests = lambda requests: iter(
+            [tasks["inbox"] + tasks["one"] + tasks["two"], lists])
+        changed_lists, changed_tasks = self.wl.sync()
+        self.assertTrue(inbox.loaded)
+        self.assertEqual([t.id for t in changed_tasks], ["a"])
+        self.assertEqual(sent[-1], "/two/tasks")
+
+    def test_refresher(self):
+        wl = Wunderlist(response_cache=api.ResponseCache())
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox"}]
+        lists = []
+        # a ResponseCache hands back the same objects after a 304
+        wl.send_request = lambda request: (tasks if request.url.endswith(
+            "/me/tasks") else lists)
+        wl.update_lists()
+        self.assertEqual(wl.sync(), ([], []))
+
+        changes = []
+        refresher = Refresher(wl, interval=1, max_interval=3,
+                              on_change=lambda *c: changes.append(c))
+        self.assertFalse(refresher.refresh())
+        self.assertEqual(refresher.current_interval, 2)
+        self.assertFalse(refresher.refresh())
+        self.assertEqual(refresher.current_interval, 3)
+
+        tasks = [{"title": "b", "id": "b", "list_id": "inbox"}]
+        self.assertTrue(refresher.refresh())
+        self.assertEqual(refresher.current_interval, 1)
+        self.assertEqual([t.id for t in changes[0][1]], ["b", "a"])
+
+        errors = []
+        refresher.on_error = errors.append
+        refresher.on_change = lambda *changes: {}["broken"]
+        tasks = [{"title": "c", "id": "c", "list_id": "inbox"}]
+        self.assertTrue(refresher.refresh())
+        self.assertIsInstance(errors[0], KeyError)
+
+        wl.send_request = lambda request: 1 / 0
+        refresher.start()
+        refresher.stop(5)
+        self.assertIsInstance(errors[1], ZeroDivisionError)
+
+    def fake_server(self):
+        '''Answer requests locally, like the server would.'''
+
+        sent = []
+        batches = []
+        stored = {}
+
+        def respond(request):
+            sent.append(request)
+            data = request.data if isinstance(request.data, dict) else {}
+            object_id = request.url.rsplit("/", 1)[-1]
+            if object_id not in stored:  # creating something
+                object_id = "id{}".format(len(sent))
+                stored[object_id] = {"id": object_id}
+            stored[object_id].update(data)
+            return dict(stored[object_id])
+
+        def stream_requests(requests):
+            batches.append(len(requests))
+            for request in requests:
+                yield api.BatchResult(200, respond(request), None)
+
+        self.wl.send_request = respond
+        self.wl.stream_requests = stream_requests
+        return sent, batches
+
+    def test_thread_safe(self):
+        wl = Wunderlist(thread_safe=True)
+        today = date.today()
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox",
+                  "due_date": today.isoformat()}]
+        wl.send_requests = lambda requests: iter([tasks, [{"title": "one",
+                                                           "id": "one"}]])
+        wl.update_lists()
+        one = wl.list_with_title("one")
+
+        def read():
+            tasks = wl.tasks_due_before(today + timedelta(days=1))
+            return sorted(t.title for t in tasks)
+
+        seen = []
+
+        def respond(request):
+            # the write lock is held, readers still go ahead
+            reader = threading.Thread(target=lambda: seen.append(read()))
+            reader.start()
+            reader.join(5)
+            return {"title": "b", "id": "b", "list_id": "inbox",
+                    "due_date": today.isoformat()}
+        wl.send_request = respond
+
+        wl.add_task("b", due_date=today.isoformat())
+        self.assertEqual(seen, [["a"]])
+        self.assertEqual(read(), ["a", "b"])
+        # readers get copies, and unchanged lists aren't copied again
+        self.assertIsNot(wl.get_task("a", "inbox"), wl._lists[0].tasks[0])
+        self.assertIs(wl.list_with_title("one"), one)
+
+    def test_write_behind(self):
+        sent, batches = self.fake_server()
+        self.wl.enable_write_behind(max_size=3, max_delay=60)
+
+        self.wl.add_task("one")
+        self.wl.add_task("two", note="note")
+        one = self.wl.get_task("one", "inbox")
+        self.assertIsNone(one.id)
+        self.assertEqual(sent, [])
+
+        # two has no id yet, so this sends the queue first
+        self.wl.update_task_title("two", "three")
+        self.assertEqual(batches, [2, 1])  # the note needed two's id
+        self.assertEqual(one.id, "id1")
+        self.assertIs(self.wl._task_ids["id1"], one)
+        self.assertIs(self.wl.task_with_id("id1"), one)
+        three = self.wl.get_task("three", "inbox")
+        self.assertEqual(three["note"], "note")
+
+        self.wl.complete_task("one")
+        self.assertTrue(one.completed)
+        self.wl.delete_task("three")  # third queued request
+        self.assertIsNone(self.wl.get_task("three", "inbox"))
+        self.assertIsNone(self.wl.task_with_id(three.id))
+        self.assertEqual(batches, [2, 1, 3])
+
+        self.wl.add_list("list")
+        self.assertIsNone(self.wl.list_with_title("list").id)
+        self.wl.disable_write_behind()
+        self.assertEqual(batches, [2, 1, 3, 1])
+        self.assertEqual(self.wl.list_with_title("list").id, "id7")
+        self.assertIs(self.wl.list_with_id("id7"),
+                      self.wl.list_with_title("list"))
+
+        self.wl.add_task("four", list_title="list")  # sent right away
+        self.assertEqual(self.wl.get_task("four", "list").id, "id8")
+        self.assertEqual(len(batches), 4)
+
+    def test_write_behind_failures(self):
+        sent, batches = self.fake_server()
+        self.wl.add_task("kept")
+        kept = self.wl.get_task("kept", "inbox")
+        self.wl.enable_write_behind(max_size=10, max_delay=60)
+
+        self.wl.add_task("lost")
+        self.wl.update_task_title("kept", "renamed")
+        self.wl.delete_task("renamed")
+        self.wl.add_list("list")
+
+        def fail(requests):
+            for request in requests:
+                yield api.BatchResult(500, None, Exception(500, None))
+        self.wl.stream_requests = fail
+        self.assertRaises(Exception, self.wl.flush)
+        # every change was undone
+        self.assertIsNone(self.wl.get_task("lost", "inbox"))
+        self.assertIs(self.wl.get_task("kept", "inbox"), kept)
+        self.assertEqual(kept.title, "kept")
+        self.assertIsNone(self.wl.list_with_title("list"))
+
+        # sync sends the queue first, so new tasks aren't taken as deleted
+        self.fake_server()
+        self.wl.add_task("new")
+        self.wl.send_requests = lambda requests: iter(
+            [[{"title": "kept", "id": kept.id, "list_id": "inbox"}], []])
+        self.wl.sync()
+        self.assertEqual(len(self.wl.queue), 0)
+        self.wl.add_task("newer")
+        self.wl.merge_lists([], [])
+        self.assertIsNotNone(self.wl.get_task("newer", "inbox"))
+
+        # whatever is left is sent once the oldest change is max_delay old
+        self.wl.queue.max_delay = 0.2
+        self.wl._flush_timer.cancel()
+        self.wl._flush_timer = None
+        self.wl.add_task("last")
+        timer = self.wl._flush_timer
+        timer.join(5)
+        self.assertEqual(len(self.wl.queue), 0)
+        self.assertIsNotNone(self.wl.get_task("last", "inbox").id)
+
+    def test_write_behind_deletes(self):
+        sent, batches = self.fake_server()
+        self.wl.add_task("t1")
+        self.wl.add_list("l1")
+        inbox = self.wl.list_with_title("inbox")
+
+        # a failed delete puts back the one copy it removed
+        self.wl.enable_write_behind(max_size=1, max_delay=60)
+
+        def fail(requests):
+            for request in requests:
+                yield api.BatchResult(500, None, Exception(500, None))
+        self.wl.stream_requests = fail
+        self.assertRaises(Exception, self.wl.delete_task, "t1")
+        self.assertEqual([t.title for t in inbox.tasks], ["t1"])
+        self.assertRaises(Exception, self.wl.delete_list, "l1")
+        self.assertEqual(
+            [l.title for l in self.wl.lists].count("l1"), 1)
+
+        # a delete that went through stays done when another change fails
+        self.wl.queue.max_size = 10
+
+        def fail_adds(requests):
+            for request in requests:
+                if request.method == "POST":
+                    yield api.BatchResult(500, None, Exception(500, None))
+                else:
+                    yield api.BatchResult(200, {}, None)
+        self.wl.stream_requests = fail_adds
+        self.wl.delete_task("t1")
+        self.wl.delete_list("l1")
+        self.wl.add_task("u1")
+        self.assertRaises(Exception, self.wl.flush)
+        self.assertEqual(inbox.tasks, [])
+        self.assertIsNone(self.wl.list_with_title("l1"))
+
+    def test_find_tasks(self):
+        today = date.today()
+        tasks = [Task({"title": "a", "due_date": today.isoformat(),
+                       "starred": 1}),
+                 Task({"title": "b", "due_date": today.isoformat(),
+                       "starred": 1, "completed_at": "date"}),
+                 Task({"title": "c", "due_date": today.isoformat()}),
+                 Task({"title": "d", "starred": 1}),
+                 Task({"title": "e", "starred": 1,
+                       "due_date": (today + timedelta(days=3)).isoformat()})]
+        self.inbox.tasks = tasks
+
+        def titles(**conditions):
+            return [t.title for t in self.wl.find_tasks(**conditions)]
+
+        tomorrow = today + timedelta(days=1)
+        self.assertEqual(titles(due_before=tomorrow, completed=False,
+                                starred=True), ["a"])
+        self.assertEqual(titles(starred=True), ["a", "b", "d", "e"])
+        self.assertEqual(titles(completed=True), ["b"])
+        self.assertEqual(titles(due_from=tomorrow), ["e"])
+        self.assertEqual(titles(due_on=today, starred=False), ["c"])
+        self.assertEqual(titles(), ["a", "b", "c", "d", "e"])
+
+        if query.numpy is not None:  # run the same checks without numpy
+            numpy, query.numpy = query.numpy, None
+            try:
+                self.test_find_tasks()
+            finally:
+                query.numpy = numpy
+
+    def test_indexes(self):
+        one = TaskList({"title": "one", "id": "one"})
+        task = Task({"title": "task", "id": "task"})
+        one.add_task(task)
+        self.wl.lists.append(one)
+        self.assertIs(self.wl.list_with_id("one"), one)
+        self.assertIs(self.wl.task_with_id("task"), task)
+
+        task["title"] = "renamed"
+        self.assertIsNone(self.wl.get_task("task", "one"))
+        self.assertIs(self.wl.get_task("renamed", "one"), task)
+
+        task.info = {"title": "again", "id": "new_id"}
+        self.assertEqual(one.tasks_with_title("renamed"), [])
+        self.assertIs(one.task_with_id("new_id"), task)
+        self.assertIsNone(one.task_with_id("task"))
+        self.assertIsNone(self.wl.task_with_id("task"))
+        self.assertIs(self.wl.task_with_id("new_id"), task)
+
+        one["title"] = "two"
+        self.wl.lists = list(self.wl.lists)
+        self.assertIs(self.wl.list_with_title("two"), one)
+
+        # unique keys map to the object itself, shared ones to a list
+        a, b, c = [Task({"title": "same", "id": n}) for n in "abc"]
+        index = Index("title", [a, b])
+        self.assertEqual(index.get("same"), [a, b])
+        self.assertTrue(index.remove(a))
+        self.assertIs(index.buckets["same"], b)
+        self.assertFalse(index.remove(c))
+        index.add(c)
+        self.assertIs(index.first("same"), b)
+        self.assertTrue(index.remove(b) and index.remove(c))
+        self.assertEqual((index.get("same"), index.size), ([], 0))
+        self.assertIs(Index("id", [a]).buckets["a"], a)
+
+    def test_dump_and_load_lists(self):
+        tasks = [{"title": "a", "id": "a", "list_id": "inbox"},
+                 {"title": "b", "id": "b", "list_id": "one"},
+                 {"title": "c", "id": "c", "list_id": "gone"}]
+        lists = [{"title": "one", "id": "one"}]
+        self.wl.load_lists(tasks, lists)
+        self.assertEqual(self.wl.dump_lists(), (tasks, lists))
+
+        other = Wunderlist()
+        other.load_lists(*self.wl.dump_lists())
+        self.assertEqual([l.id for l in other.lists], ["inbox", "one"])
+        self.assertEqual(other.get_task("b", "one").id, "b")
+
+    def test_group_tasks(self):
+        tasks = [{"id": "a", "list_id": "one"}, {"id": "b", "list_id": "x"},
+                 {"id": "c", "list_id": "one"}]
+        buckets, orphans = group_tasks(tasks, ["one", "two"])
+        self.assertEqual(buckets, {"one": [tasks[0], tasks[2]], "two": []})
+        self.assertEqual(orphans, [tasks[1]])
+
 
 class TestTaskList(unittest.TestCase):
     def setUp(self):
@@ -166,13 +570,33 @@ class TestTaskList(unittest.TestCase):
         self.assertEqual(self.test_list.tasks_due_on(now),
                          [today])
 
+    def test_due_between(self):
+        now = date.today()
+        days = [now + timedelta(days=n) for n in range(5)]
+        tasks = [Task({"title": str(n), "due_date": day.isoformat()})
+                 for n, day in reversed(list(enumerate(days)))]
+        for task in tasks:
+            self.test_list.add_task(task)
+        self.test_list.add_task(Task({"title": "no due date"}))
+
+        between = self.test_list.tasks_due_between(days[1], days[3])
+        self.assertEqual([t.title for t in between], ["1", "2", "3"])
+
+        # changes are picked up without rebuilding
+        tasks[0]["due_date"] = now.isoformat()  # was days[4]
+        self.test_list.remove_task(tasks[4])  # due today
+        self.assertEqual(self.test_list.tasks_due_on(now), [tasks[0]])
+        self.assertEqual([t.title for t in
+                          self.test_list.tasks_due_before(days[4])],
+                         ["4", "1", "2", "3"])
+
     def test_incomplete_tasks(self):
         one = Task({"title": "one", "completed_at": "date"})
         two = Task({"title": "two", "id": "two"})  # not completed
         self.test_list.add_task(one)
         self.test_list.add_task(two)
 
-        self.assertEqual(self.test_list.incomplete_tasks(), [one])
+        self.assertEqual(self.test_list.incomplete_tasks(), [two])
 
 
 class TestTask(unittest.TestCase):
@@ -191,3 +615,598 @@ class TestTask(unittest.TestCase):
         self.assertEqual(self.task.due_date, self.due)
         self.assertEqual(self.task.completed, False)
         self.assertEqual(self.task.created_at, self.now)
+
+    def test_subtasks(self):
+        self.assertEqual(self.task.subtasks, [])
+        subtask = Task({"title": "sub"})
+        self.task.subtasks.append(subtask)
+        self.assertEqual(self.task.subtasks, [subtask])
+        self.assertFalse(hasattr(self.task, "__dict__"))
+
+    def test_cached_dates(self):
+        self.assertIs(self.task.created_at, self.task.created_at)
+        self.assertIs(self.task.due_date, self.task.due_date)
+        tomorrow = self.due + timedelta(days=1)
+        self.task["due_date"] = tomorrow.isoformat()
+        self.assertEqual(self.task.due_date, tomorrow)
+        self.task.info = {"title": "task"}
+        self.assertIsNone(self.task.due_date)
+
+    def test_parse_datetime(self):
+        for value in ["2013-09-13", "2013-09-13T10:20", "2013-09-13T10:20:30",
+                      "2013-09-13T10:20:30.5", "2013-09-13T10:20:30.123456Z",
+                      "2013-09-13T10:20:30+02:00", "2013-09-13T10:20:30-0130",
+                      "Sep 13 2013"]:
+            self.assertEqual(parse_datetime(value),
+                             dateutil.parser.parse(value))
+
+
+class TestAPIClient(unittest.TestCase):
+    def test_session(self):
+        session = api.make_session(pool_maxsize=4, keep_alive=False)
+        for url in (api.calls.API_URL, api.calls.COMMENTS_URL):
+            adapter = session.get_adapter(url)
+            self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertIsNot(session.get_adapter(api.calls.API_URL),
+                         session.get_adapter(api.calls.COMMENTS_URL))
+        self.assertEqual(session.headers["Connection"], "close")
+
+        one = api.APIClient(session=session)
+        two = Wunderlist(session=session)
+        self.assertIs(one.session, two.session)
+
+    def fake_batches(self, client, statuses=None):
+        '''Answer /batch calls locally, each op's body is its url.'''
+
+        sent = []
+
+        def send(prepared, timeout=30, stream=False):
+            body = json.loads(prepared.body)
+            body["stream"] = stream
+            sent.append(body)
+            results = [{"status": (statuses or {}).get(op["url"], 200),
+                        "body": op["url"]} for op in body["ops"]]
+            response = Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(json.dumps({"results": results})
+                                      .encode("utf-8"))
+            return response
+        client.session.send = send
+        return sent
+
+    def test_batch_chunks(self):
+        client = api.APIClient()
+        client.batch_size = 2
+        sent = self.fake_batches(client)
+
+        requests = [api.calls.delete_list(str(n)) for n in range(5)]
+        results = list(client.send_requests(requests))
+        self.assertEqual(results, ["/0", "/1", "/2", "/3", "/4"])
+        self.assertEqual([len(b["ops"]) for b in sent], [2, 2, 1])
+        self.assertTrue(all(b["sequential"] for b in sent))
+
+        del sent[:]
+        requests = [api.calls.delete_list(str(n)) for n in range(5)]
+        results = list(client.send_requests(requests, sequential=False))
+        self.assertEqual(results, ["/0", "/1", "/2", "/3", "/4"])
+        self.assertFalse(any(b["sequential"] for b in sent))
+
+    def test_stream_requests(self):
+        client = api.APIClient()
+        sent = self.fake_batches(client, statuses={"/1": 404})
+
+        requests = [api.calls.delete_list(str(n)) for n in range(3)]
+        results = list(client.stream_requests(requests))
+        self.assertEqual([r.status for r in results], [200, 404, 200])
+        self.assertEqual([r.body for r in results], ["/0", "/1", "/2"])
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[1].error)
+
+        self.assertTrue(sent[-1]["stream"])
+
+        requests = [api.calls.delete_list(str(n)) for n in range(3)]
+        results = client.send_requests(requests)
+        self.assertEqual(next(results), "/0")
+        self.assertRaises(Exception, next, results)
+        self.assertFalse(sent[-1]["stream"])  # decoded whole by the codec
+
+    def test_iter_tasks(self):
+        wl = Wunderlist()
+        wl.load_lists([], [{"title": "one", "id": "one"}])
+        tasks = [{"title": str(n), "id": str(n), "list_id": "one"}
+                 for n in range(5)]
+        tasks[4]["list_id"] = "gone"
+        urls = []
+
+        def send(prepared, timeout=30, stream=False):
+            urls.append(prepared.url)
+            self.assertTrue(stream)
+            body = tasks
+            if "per_page=2" in prepared.url:
+                page = int(prepared.url.split("page=")[1][0])
+                body = tasks[(page - 1) * 2:page * 2]
+            response = Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(json.dumps(body).encode("utf-8"))
+            return response
+        wl.session.send = send
+
+        streamed = list(wl.iter_tasks())
+        self.assertEqual([t.id for t in streamed], ["0", "1", "2", "3", "4"])
+        self.assertIs(streamed[0].parent_list, wl.list_with_title("one"))
+        self.assertIsNone(streamed[4].parent_list)
+        self.assertEqual(wl.tasks_for_list("one"), [])
+
+        paged = list(wl.iter_tasks(per_page=2))
+        self.assertEqual([t.id for t in paged], ["0", "1", "2", "3", "4"])
+        self.assertEqual(len(urls), 4)
+        self.assertTrue(urls[-1].endswith("/me/tasks?page=3&per_page=2"))
+
+        # a server ignoring paging sends everything once, or the same page
+        del urls[:]
+        ignored = list(wl.iter_tasks(per_page=3))
+        self.assertEqual([t.id for t in ignored], ["0", "1", "2", "3", "4"])
+        self.assertEqual(len(urls), 1)
+        del tasks[3:]
+        del urls[:]
+        repeated = list(wl.iter_tasks(per_page=3))
+        self.assertEqual([t.id for t in repeated], ["0", "1", "2"])
+        self.assertEqual(len(urls), 2)
+
+    def test_retry(self):
+        statuses = [503, 404, 200]
+        client = api.APIClient(retry_policy=api.RetryPolicy(backoff=0))
+
+        def send(prepared, timeout=30, stream=False):
+            response = Response()
+            response.status_code = statuses.pop(0)
+            response.raw = io.BytesIO(b'{"id": "me"}')
+            return response
+        client.session.send = send
+
+        # no write yet, so the 404 is real
+        self.assertRaises(Exception, client.send_request, api.calls.me())
+        self.assertEqual(statuses, [200])
+
+        # the server may have added it before failing
+        statuses = [502, 201]
+        self.assertRaises(Exception, client.send_request,
+                          api.calls.add_list("list"))
+        self.assertEqual(statuses, [201])
+
+        statuses = [201, 404, 200]
+        client.send_request(api.calls.add_list("list"))
+        self.assertEqual(client.send_request(api.calls.me()), {"id": "me"})
+        self.assertEqual(statuses, [])
+
+        statuses = [503, 200]
+        client.retry_policy = api.NO_RETRY
+        self.assertRaises(Exception, client.send_request, api.calls.me())
+
+    def test_retry_policy(self):
+        policy = api.RetryPolicy(max_attempts=3, backoff=1, max_elapsed=10,
+                                 jitter=False)
+        self.assertEqual(policy.next_delay(1, 0, 503), 1)
+        self.assertEqual(policy.next_delay(2, 0, 429), 2)
+        self.assertIsNone(policy.next_delay(3, 0, 503))  # out of attempts
+        self.assertIsNone(policy.next_delay(1, 0, 400))  # not retryable
+        self.assertEqual(policy.next_delay(1, 0, None), 1)  # connection
+        self.assertEqual(policy.next_delay(1, 0, 503, "5"), 5)
+        self.assertIsNone(policy.next_delay(1, 0, 503, "11"))  # too long
+        self.assertIsNone(policy.next_delay(2, 9, 503))
+
+        self.assertIsNone(policy.next_delay(1, 0, 502, method="POST"))
+        self.assertEqual(policy.next_delay(1, 0, 429, method="POST"), 1)
+        self.assertIsNone(policy.next_delay(1, 0, None, method="POST"))
+        self.assertEqual(policy.next_delay(1, 0, None, method="POST",
+                                           sent=False), 1)
+        self.assertEqual(policy.next_delay(1, 0, None, method="PUT"), 1)
+        self.assertIsNone(policy.next_delay(1, 0, 404))
+        self.assertIsNone(policy.next_delay(1, 0, 404, since_write=6))
+        self.assertEqual(policy.next_delay(1, 0, 404, method="PUT",
+                                           since_write=1), 1)
+
+        policy.jitter = True
+        for attempt in range(1, 3):
+            delay = policy.next_delay(attempt, 0, 503)
+            self.assertTrue(0 <= delay <= 2 ** (attempt - 1))
+
+    def test_last_write(self):
+        client = api.APIClient()
+
+        def send(prepared, timeout=30, stream=False):
+            response = Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(b'{"results": []}')
+            return response
+        client.session.send = send
+
+        reads = api.calls.batch([api.calls.get_lists(), api.calls.me()])
+        client.send_request(reads)
+        self.assertIsNone(client.last_write)
+        client.send_request(api.calls.batch([api.calls.get_lists(),
+                                             api.calls.delete_list("l")]))
+        self.assertIsNotNone(client.last_write)
+
+    def test_rate_limiter(self):
+        limiter = api.RateLimiter(rate=100, burst=2, per_token_rate=10,
+                                  per_token_burst=1)
+        self.assertEqual(limiter.reserve("a"), 0)
+        self.assertEqual(limiter.reserve("b"), 0)
+        # the global burst is used up, and a's bucket too
+        self.assertAlmostEqual(limiter.reserve("a"), 0.1, places=2)
+        self.assertAlmostEqual(limiter.reserve("c"), 0.02, places=2)
+
+        metrics = limiter.metrics()
+        self.assertEqual(metrics["requests"], 4)
+        self.assertEqual(metrics["throttled"], 2)
+        self.assertGreater(metrics["current_wait"], 0)
+
+        client = api.APIClient(rate_limiter=limiter)
+        self.fake_batches(client)
+        list(client.send_requests([api.calls.me()]))
+        self.assertEqual(limiter.metrics()["requests"], 5)
+
+    def test_response_cache(self):
+        cache = api.ResponseCache(max_entries=1)
+        client = api.APIClient(response_cache=cache)
+        client.set_token("token")
+        sent = []
+
+        def send(prepared, timeout=30, stream=False):
+            sent.append(dict(prepared.headers))
+            response = Response()
+            if prepared.headers.get("If-None-Match") == '"v1"':
+                response.status_code = 304
+                response.raw = io.BytesIO(b"")
+            else:
+                response.status_code = 200
+                response.headers["ETag"] = '"v1"'
+                response.raw = io.BytesIO(b'{"id": 1}')
+            return response
+        client.session.send = send
+
+        self.assertEqual(client.send_request(api.calls.me()), {"id": 1})
+        self.assertEqual(client.send_request(api.calls.me()), {"id": 1})
+        self.assertNotIn("If-None-Match", sent[0])
+        self.assertEqual(sent[1]["If-None-Match"], '"v1"')
+        self.assertNotIn("If-None-Match", client.headers)
+
+        # only the most recent URL is kept
+        client.send_request(api.calls.get_all_tasks())
+        self.assertIsNone(cache.get(cache.key("token", api.calls.me().url)))
+
+        # callers get their own copy of the body
+        body = client.send_request(api.calls.get_all_tasks())
+        body["id"] = 2
+        self.assertEqual(client.send_request(api.calls.get_all_tasks()),
+                         {"id": 1})
+
+    def test_response_cache_file(self):
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home)
+        path = os.path.join(home, "cache")
+        key = api.ResponseCache.key("secret-token", api.calls.me().url)
+        self.assertNotIn("secret-token", key)
+
+        cache = api.ResponseCache(path=path)
+        cache.set(key, api.cache.CacheEntry('"v1"', None, {"id": 1}))
+        cache.close()
+        cache = api.ResponseCache(path=path)
+        self.assertEqual(cache.get(key), ('"v1"', None, {"id": 1}))
+        self.assertFalse([k for k in cache.shelf.keys()
+                          if "secret-token" in k])
+        cache.close()
+
+    def test_codecs(self):
+        data = {"title": u"\u2713", "ids": [1, 2], "starred": False}
+        for name, available in codec.AVAILABLE.items():
+            if not available:
+                self.assertRaises(ValueError, codec.get_codec, name)
+                continue
+            json_codec = codec.get_codec(name)
+            encoded = json_codec.dumps(data)
+            if not isinstance(encoded, bytes):
+                encoded = encoded.encode("utf-8")
+            self.assertEqual(json_codec.loads(encoded), data)
+
+        client = api.APIClient(codec="json")
+        self.assertEqual(client.codec.name, "json")
+        self.assertRaises(ValueError, api.APIClient, codec="yaml")
+
+    def test_operations(self):
+        title = api.calls.set_title_for_task("t", u"\u2713")
+        self.assertEqual(title.url, api.calls.API_URL + "/t")
+        body = title.body()
+        self.assertIs(title.body(), body)  # encoded once
+        self.assertEqual(json.loads(body.decode("utf-8")),
+                         {"title": u"\u2713"})
+
+        comment = api.calls.get_comments("t")
+        request = api.calls.batch([title, comment], sequential=False)
+        self.assertEqual(json.loads(request.body().decode("utf-8")), {
+            "ops": [{"method": "PUT", "url": "/t",
+                     "params": {"title": u"\u2713"}},
+                    {"method": "GET", "url": comment.url, "params": {}}],
+            "sequential": False})
+
+        paged = api.calls.get_all_tasks(2, 50)
+        self.assertEqual(paged.path, "/me/tasks")
+        self.assertEqual(paged.url,
+                         api.calls.API_URL + "/me/tasks?page=2&per_page=50")
+        self.assertEqual(json.loads(paged.batch_op().decode("utf-8"))["url"],
+                         "/me/tasks?page=2&per_page=50")
+        self.assertEqual(endpoint(paged), "GET /me/tasks")
+
+    def test_metrics_hooks(self):
+        metrics = api.MetricsHook()
+        statsd = api.StatsDHook(port=9)
+        client = api.APIClient(retry_policy=api.RetryPolicy(backoff=0),
+                               hooks=[metrics, statsd])
+        statuses = [503, 200, 400]
+
+        def send(prepared, timeout=30, stream=False):
+            response = Response()
+            response.status_code = statuses.pop(0)
+            response.raw = io.BytesIO(b'{"id": "me"}')
+            return response
+        client.session.send = send
+
+        client.send_request(api.calls.complete_task("t1"))
+        self.assertRaises(Exception, client.send_request,
+                          api.calls.delete_task("t2"))
+        put = metrics.endpoints["PUT /:id"]
+        self.assertEqual((put.requests, put.retries, put.errors), (1, 1, 0))
+        self.assertEqual(put.bytes_received, len(b'{"id": "me"}'))
+        self.assertEqual(metrics.endpoints["DELETE /:id"].errors, 1)
+
+        self.fake_batches(client)
+        list(client.send_requests([api.calls.me(), api.calls.me()]))
+        self.assertEqual(metrics.endpoints["POST /batch"].requests, 1)
+        self.assertEqual(len(metrics.slowest(2)), 2)
+
+        text = metrics.prometheus_text()
+        self.assertIn('wunderpy_retries_total{endpoint="PUT /:id"} 1', text)
+        self.assertIn('wunderpy_request_duration_seconds_bucket{endpoint='
+                      '"POST /batch",le="+Inf"} 1', text)
+
+        event = RequestEvent(api.calls.get_comments("t1"))
+        event.attempts, event.elapsed = 1, 0.25
+        self.assertEqual(statsd.lines(event)[:2], [
+            "wunderpy.GET.tasks.id.messages.requests:1|c",
+            "wunderpy.GET.tasks.id.messages.latency:250.000|ms"])
+        statsd.close()
+
+    def test_account_pool(self):
+        pool = api.AccountPool(max_workers=2, client_class=Wunderlist)
+        for token in ("a", "b", "c"):
+            pool.add(token)
+        self.assertIs(pool.add("a"), pool.client("a"))
+        self.assertTrue(all(c.session is pool.session for c in pool))
+        self.assertTrue(all(c.response_cache is pool.client("a")
+                            .response_cache for c in pool))
+
+        def send(prepared, timeout=30, stream=False):
+            token = prepared.headers["Authorization"].split()[-1]
+            response = Response()
+            response.status_code = 401 if token == "b" else 200
+            response.headers["ETag"] = '"1"'
+            response.raw = io.BytesIO(json.dumps([token]).encode("utf-8"))
+            return response
+        pool.session.send = send
+
+        results = list(pool.send_request_all(api.calls.get_all_tasks))
+        self.assertEqual([r.token for r in results], ["a", "b", "c"])
+        self.assertEqual(results[0].body, ["a"])
+        self.assertIsNone(results[1].body)
+        self.assertEqual(results[1].error.args[0], 401)
+        self.assertEqual(results[2].body, ["c"])
+
+        results = pool.map(lambda client: client.token.upper(), ["c"])
+        self.assertEqual(list(results), [api.AccountResult("c", "C", None)])
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.paths = storage.CONFIG_PATH, storage.SNAPSHOT_PATH
+        storage.CONFIG_PATH = os.path.join(self.home, "config")
+        storage.SNAPSHOT_PATH = os.path.join(self.home, "snapshot")
+
+    def tearDown(self):
+        storage.CONFIG_PATH, storage.SNAPSHOT_PATH = self.paths
+        shutil.rmtree(self.home)
+
+    def test_token(self):
+        storage.save_token("one")
+        with open(storage.CONFIG_PATH, "w") as config:
+            json.dump({"token": "one", "cache_ttl": 60}, config)
+        storage.save_token("two")
+        self.assertEqual(storage.get_config(),
+                         {"token": "two", "cache_ttl": 60})
+
+    def test_snapshot(self):
+        wl = Wunderlist()
+        wl.set_token("one")
+        wl.load_lists([{"title": "a", "id": "a", "list_id": "inbox"}], [])
+        storage.save_snapshot(wl)
+
+        same = Wunderlist()
+        same.set_token("one")
+        self.assertTrue(storage.load_snapshot(same, 60))
+        self.assertEqual(same.get_task("a", "inbox").id, "a")
+
+        other = Wunderlist()
+        other.set_token("two")  # another account
+        self.assertFalse(storage.load_snapshot(other, 60))
+        self.assertFalse(storage.load_snapshot(same, -1))  # too old
+
+
+def done(result=None):
+    '''A finished asyncio Future, so the fakes need no async syntax.'''
+
+    future = asyncio.Future()
+    future.set_result(result)
+    return future
+
+
+class FakeAsyncResponse(object):
+    '''Stands in for an aiohttp ClientResponse.'''
+
+    def __init__(self, status, body):
+        self.status = status
+        self.headers = {}
+        self.body = json.dumps(body).encode("utf-8")
+        self.content = self
+
+    def read(self):
+        return done(self.body)
+
+    def release(self):
+        pass
+
+    def iter_chunked(self, size):
+        self.chunks = iter([self.body[i:i + size]
+                            for i in range(0, len(self.body), size)])
+        return self
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = asyncio.Future()
+        try:
+            future.set_result(next(self.chunks))
+        except StopIteration:
+            future.set_exception(StopAsyncIteration())
+        return future
+
+
+class FakeAsyncSession(object):
+    '''Stands in for an aiohttp ClientSession, answering with respond.'''
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.sent = []
+
+    def request(self, method, url, data=None, headers=None, timeout=None):
+        self.sent.append((method, url))
+        status, body = self.respond(method, url, json.loads(data))
+        return done(FakeAsyncResponse(status, body))
+
+
+@unittest.skipIf(AsyncAPIClient is None, "needs python 3 and aiohttp")
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def collect(self, generator):
+        '''Read an async generator to the end.'''
+
+        items = []
+        while True:
+            try:
+                items.append(self.run_async(generator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def test_send_request(self):
+        statuses = [503, 200]
+        session = FakeAsyncSession(
+            lambda method, url, data: (statuses.pop(0), {"id": "me"}))
+        client = AsyncAPIClient(session,
+                                retry_policy=api.RetryPolicy(backoff=0))
+        self.assertEqual(self.run_async(client.send_request(api.calls.me())),
+                         {"id": "me"})
+        self.assertEqual(len(session.sent), 2)
+
+    def test_stream_requests(self):
+        def respond(method, url, data):
+            results = [{"status": 404 if op["url"] == "/1" else 200,
+                        "body": op["url"]} for op in data["ops"]]
+            return 200, {"results": results}
+        client = AsyncAPIClient(FakeAsyncSession(respond))
+        client.batch_size = 2
+
+        requests = [api.calls.delete_list(str(n)) for n in range(3)]
+        results = self.collect(client.stream_requests(requests))
+        self.assertEqual([r.status for r in results], [200, 404, 200])
+        self.assertEqual([r.body for r in results], ["/0", "/1", "/2"])
+        self.assertEqual(len(client.session.sent), 2)
+
+        results = self.collect(client.stream_requests(requests,
+                                                      sequential=False))
+        self.assertEqual([r.body for r in results], ["/0", "/1", "/2"])
+
+        requests = [api.calls.delete_list(str(n)) for n in (0, 2)]
+        self.assertEqual(self.collect(client.send_requests(requests)),
+                         ["/0", "/2"])
+        requests.append(api.calls.delete_list("1"))
+        self.assertRaises(Exception, self.collect,
+                          client.send_requests(requests))
+
+    def test_wunderlist(self):
+        account = {"tasks": [{"title": "a", "id": "a", "list_id": "inbox"}],
+                   "lists": [{"title": "one", "id": "one"}]}
+
+        def respond(method, url, data):
+            bodies = {"/me/tasks": account["tasks"],
+                      "/me/lists": account["lists"]}
+            return 200, {"results": [{"status": 200, "body": bodies[op["url"]]}
+                                     for op in data["ops"]]}
+        wl = AsyncWunderlist(session=FakeAsyncSession(respond))
+        self.run_async(wl.update_lists())
+        self.assertEqual([l.title for l in wl.lists], ["inbox", "one"])
+        task_a = wl.get_task("a", "inbox")
+
+        account["tasks"] = [{"title": "a", "id": "a", "list_id": "one"},
+                            {"title": "b", "id": "b", "list_id": "inbox"}]
+        changed_lists, changed_tasks = self.run_async(wl.sync())
+        self.assertEqual(sorted(t.id for t in changed_tasks), ["a", "b"])
+        self.assertIs(wl.get_task("a", "one"), task_a)
+
+        for unsupported in (wl.prefetch, wl.enable_write_behind, wl.flush):
+            self.assertRaises(TypeError, unsupported)
+
+    def test_refresher(self):
+        wl = AsyncWunderlist(session=FakeAsyncSession(None))
+        changes = [([], ["task"]), ([], [])]
+        wl.sync = lambda: done(changes.pop(0))
+        errors = []
+        refresher = AsyncRefresher(wl, interval=1, max_interval=4,
+                                   on_change=lambda *c: 1 / 0,
+                                   on_error=errors.append)
+
+        self.assertTrue(self.run_async(refresher.refresh()))
+        self.assertIsInstance(errors[0], ZeroDivisionError)
+        self.assertFalse(self.run_async(refresher.refresh()))
+        self.assertEqual(refresher.current_interval, 2)
+
+
+class TestStream(unittest.TestCase):
+    def test_array_decoder(self):
+        document = json.dumps({"before": [1, "]"], "results": [
+            {"status": 200, "body": {"title": u"\u2713"}}, 12, None,
+            [1, [2]]], "after": 1}).encode("utf-8")
+        expected = json.loads(document.decode("utf-8"))["results"]
+        for size in (1, 3, 1024):
+            chunks = [document[i:i + size]
+                      for i in range(0, len(document), size)]
+            self.assertEqual(list(iter_array(chunks, "results")), expected)
+
+        document = json.dumps([{"a": "x\\\"]}{", "b": [1, {"c": "\\"}]},
+                               -1.5e3, True, None, "["] * 3).encode("utf-8")
+        for size in (1, 2, 5):
+            chunks = [document[i:i + size]
+                      for i in range(0, len(document), size)]
+            self.assertEqual(list(iter_array(chunks)), json.loads(document))
+
+        self.assertEqual(list(iter_array([b" [1", b"2, 3 ]"])), [12, 3])
+        self.assertEqual(list(iter_array([b"[]"])), [])
+        self.assertRaises(ValueError, list, iter_array([b"[1, 2"]))
@@ -1,5 +1,10 @@
 '''Interface package for the Wunderlist API'''
 
 
-from wunderpy.api.client import APIClient
+from wunderpy.api.client import APIClient, BatchResult, make_session
+from wunderpy.api.retry import RetryPolicy, NO_RETRY
+from wunderpy.api.rate_limit import RateLimiter
+from wunderpy.api.cache import ResponseCache
+from wunderpy.api.metrics import Hook, MetricsHook, StatsDHook
+from wunderpy.api.pool import AccountPool, AccountResult
 import wunderpy.api.calls
@@ -0,0 +1,311 @@
+'''An asyncio version of the API client, built on aiohttp.
+
+This module needs python 3 and aiohttp, so it isn't imported by
+wunderpy.api itself:
+
+    from wunderpy.api.async_client import AsyncAPIClient
+'''
+
+
+import asyncio
+import time
+
+import aiohttp
+
+from wunderpy.api.calls import batch
+from wunderpy.api.calls import login as login_call
+from wunderpy.api.client import APIClient, batch_result, chunked
+from wunderpy.api.stream import ArrayDecoder
+from wunderpy.api.retry import RetryPolicy
+from wunderpy.api.cache import CacheEntry
+from wunderpy.api.codec import JSONCodec, get_codec
+from wunderpy.api.metrics import RequestEvent
+
+
+class AsyncAPIClient(APIClient):
+    '''Like APIClient, but every request is a coroutine.
+
+    The Operation builders in wunderpy.api.calls are used as they are.
+    Many clients can run on one event loop, and can share one
+    aiohttp.ClientSession (and so one connection pool).
+    '''
+
+    def __init__(self, session=None, limit=100, limit_per_host=10,
+                 retry_policy=None, rate_limiter=None, response_cache=None,
+                 codec=None, hooks=None):
+        '''
+        :param session: A ClientSession to send requests with, e.g. one
+                        shared with other clients. Closing it is then
+                        up to you.
+        :type session: aiohttp.ClientSession or None
+        :param limit: Maximum open connections if no session is given.
+        :type limit: int
+        :param limit_per_host: Maximum open connections per host if no
+                               session is given.
+        :type limit_per_host: int
+        :param retry_policy: See APIClient.
+        :type retry_policy: RetryPolicy or None
+        :param rate_limiter: See APIClient. It is only ever reserved from,
+                             so the event loop is never blocked.
+        :type rate_limiter: RateLimiter or None
+        :param response_cache: See APIClient.
+        :type response_cache: ResponseCache or None
+        :param codec: See APIClient.
+        :type codec: JSONCodec, str or None
+        :param hooks: See APIClient.
+        :type hooks: list of Hook or None
+        '''
+
+        # no APIClient.__init__, that would make a blocking Session
+        self.session = session
+        self.owns_session = session is None
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        if not isinstance(codec, JSONCodec):
+            codec = get_codec(codec)
+        self.codec = codec
+        self.hooks = list(hooks or [])
+        self.token = None
+        self.id = None
+        self.headers = {"Content-Type": "application/json"}
+        self.last_write = None  # when the last write succeeded
+
+    def _get_session(self):
+        '''Return the ClientSession, making it on first use.
+
+        It has to be made while the event loop is running.
+        '''
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def close(self):
+        '''Close the ClientSession, unless it was passed in.'''
+
+        if self.owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def login(self, email, password):
+        '''Login to wunderlist'''
+
+        r = await self.send_request(login_call(email, password))
+        self.set_token(r["token"])
+        self.id = r["id"]
+
+    # set_token(self, token) is inherited from APIClient
+
+    async def send_request(self, request, timeout=30):
+        '''Send a single request to Wunderlist.
+
+        :param request: An Operation from wunderpy.api.calls.
+        :type request: Operation
+        :param timeout: Timeout duration in seconds.
+        :type timeout: int
+        :returns: dict
+        '''
+
+        event = RequestEvent(request)
+        cached = None
+        validators = {}
+        if self.response_cache is not None and request.method == "GET":
+            key = self.response_cache.key(self.token, request.url)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                if cached.etag:
+                    validators["If-None-Match"] = cached.etag
+                if cached.last_modified:
+                    validators["If-Modified-Since"] = cached.last_modified
+
+        r = await self._send(request, timeout, headers=validators,
+                             event=event)
+        try:
+            content = await r.read()
+        finally:
+            r.release()
+        event.bytes_received = len(content)
+        self._received(event)
+        if r.status == 304:  # only sent when we have validators
+            return cached.body
+
+        body = self.codec.loads(content)
+        if self.response_cache is not None and request.method == "GET":
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.response_cache.set(key, CacheEntry(etag, last_modified,
+                                                        body))
+        return body
+
+    async def _send(self, request, timeout=30, headers=None, event=None):
+        '''Send a request and return the successful (or 304) ClientResponse.
+
+        Release the response once its body has been read.
+        '''
+
+        if event is None:
+            event = RequestEvent(request)
+
+        session = self._get_session()
+        body = request.body(self.codec)
+        event.bytes_sent = len(body)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        headers = dict(self.headers, **(headers or {}))
+
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(self.token)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            event.attempts = attempt
+            self._emit("before_send", event)
+            try:
+                r = await session.request(request.method, request.url,
+                                          data=body, headers=headers,
+                                          timeout=client_timeout)
+            except aiohttp.ClientConnectionError as e:  # refused, reset...
+                sent = not isinstance(e, aiohttp.ClientConnectorError)
+                delay = self.retry_policy.next_delay(
+                    attempt, time.time() - started, method=request.method,
+                    sent=sent, since_write=self._since_write())
+                self._failed(event, None, e, delay is not None)
+                if delay is None:
+                    raise
+            else:
+                if r.status < 300 or r.status == 304:
+                    event.status = r.status
+                    self._succeeded(request)
+                    return r
+                r.release()
+                delay = self.retry_policy.next_delay(
+                    attempt, time.time() - started, r.status,
+                    r.headers.get("Retry-After"), request.method,
+                    since_write=self._since_write())
+                error = Exception(r.status, r)
+                self._failed(event, r.status, error, delay is not None)
+                if delay is None:
+                    raise error
+            await asyncio.sleep(delay)
+
+    async def send_requests(self, api_requests, timeout=30, sequential=True):
+        '''Sends requests as a batch, see APIClient.send_requests.
+
+        An async generator yielding the server response for each request
+        in the order they were supplied. Use it with async for.
+
+        :param api_requests: Operations from wunderpy.api.calls.
+        :type api_requests: list
+        :param sequential: Whether the requests must run in order.
+        :type sequential: bool
+        :yields: dict
+        '''
+
+        async for result in self._batch_results(api_requests, timeout,
+                                                sequential, stream=False):
+            if result.error is not None:
+                raise result.error
+            yield result.body
+
+    def stream_requests(self, api_requests, timeout=30, sequential=True):
+        '''Sends requests as a batch, see APIClient.stream_requests.
+
+        :yields: BatchResult
+        '''
+
+        return self._batch_results(api_requests, timeout, sequential,
+                                   stream=True)
+
+    async def _batch_results(self, api_requests, timeout, sequential,
+                             stream):
+        '''Send requests in /batch calls, see APIClient._batch_results.'''
+
+        batches = [batch(chunk, sequential)
+                   for chunk in chunked(api_requests, self.batch_size)]
+
+        if sequential:
+            for batch_request in batches:
+                if stream:
+                    async for response in self._stream_batch(batch_request,
+                                                              timeout):
+                        yield batch_result(response)
+                    continue
+                for response in await self._read_batch(batch_request,
+                                                       timeout):
+                    yield batch_result(response)
+            return
+
+        workers = asyncio.Semaphore(self.batch_workers)
+
+        async def read_batch(batch_request):
+            async with workers:
+                return await self._read_batch(batch_request, timeout)
+
+        tasks = [asyncio.ensure_future(read_batch(b)) for b in batches]
+        try:
+            for task in tasks:  # in order, whichever finishes first
+                for response in await task:
+                    yield batch_result(response)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream_request(self, request, timeout=30):
+        '''Send a single request whose response is a JSON array, see
+        APIClient.stream_request.
+
+        An async generator yielding each item of the array.
+        '''
+
+        return self._stream_array(request, timeout)
+
+    async def _read_batch(self, batch_request, timeout):
+        '''Send one /batch call, return its results.'''
+
+        event = RequestEvent(batch_request)
+        r = await self._send(batch_request, timeout, event=event)
+        try:
+            content = await r.read()
+        finally:
+            r.release()
+        event.bytes_received = len(content)
+        self._received(event)
+        return self.codec.loads(content)["results"]
+
+    def _stream_batch(self, batch_request, timeout):
+        '''Send one /batch call, yield each item of its results.'''
+
+        return self._stream_array(batch_request, timeout, "results")
+
+    async def _stream_array(self, request, timeout, key=None):
+        '''Send a request, yield each item of the array in its response.'''
+
+        event = RequestEvent(request)
+        r = await self._send(request, timeout, event=event)
+        decoder = ArrayDecoder(key)
+        try:
+            async for chunk in r.content.iter_chunked(8192):
+                event.bytes_received += len(chunk)
+                for item in decoder.feed(chunk):
+                    yield item
+            for item in decoder.close():
+                yield item
+        finally:
+            r.release()
+        self._received(event)
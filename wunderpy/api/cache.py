@@ -0,0 +1,86 @@
+'''A cache of GET responses for conditional requests.'''
+
+
+import copy
+import hashlib
+import shelve
+import threading
+from collections import namedtuple, OrderedDict
+
+
+#: A cached response: its validators and the decoded body.
+CacheEntry = namedtuple("CacheEntry", ["etag", "last_modified", "body"])
+
+
+class ResponseCache(object):
+    '''LRU cache of decoded GET responses and their ETag/Last-Modified.
+
+    APIClient sends the validators with the next GET of the same URL and
+    on a 304 returns the cached body without downloading or parsing it.
+    Bodies are copied going in and out, so callers may modify theirs.
+
+    Entries can also be kept on disk (with shelve) to survive restarts.
+    Safe to share between threads and clients, keys include a hash of
+    the token (never the token itself).
+    '''
+
+    def __init__(self, max_entries=256, path=None):
+        '''
+        :param max_entries: Most responses to keep, the least recently
+                            used are dropped first.
+        :type max_entries: int
+        :param path: File to keep the entries in as well, or None.
+        :type path: str or None
+        '''
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.shelf = None
+        if path is not None:
+            self.shelf = shelve.open(path)
+            for key in list(self.shelf.keys()):
+                self.entries[key] = CacheEntry(*self.shelf[key])
+            self._evict()
+
+    @staticmethod
+    def key(token, url):
+        '''Make the cache key for a URL fetched with an account's token.'''
+
+        account = hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+        return "{} {}".format(account, url)
+
+    def get(self, key):
+        '''Return the CacheEntry for key, or None.'''
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.entries[key] = entry  # now the most recently used
+        return entry._replace(body=copy.deepcopy(entry.body))
+
+    def set(self, key, entry):
+        '''Store a CacheEntry, evicting old ones if needed.'''
+
+        entry = entry._replace(body=copy.deepcopy(entry.body))
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            if self.shelf is not None:
+                self.shelf[key] = tuple(entry)
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            key, entry = self.entries.popitem(last=False)
+            if self.shelf is not None:
+                del self.shelf[key]
+
+    def close(self):
+        '''Write the entries to disk and close the file, if there is one.'''
+
+        with self.lock:
+            if self.shelf is not None:
+                self.shelf.close()
+                self.shelf = None
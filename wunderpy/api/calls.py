@@ -3,50 +3,184 @@
 '''
 
 import datetime
-from requests import Request
+
+try:
+    from urllib.parse import urlencode
+except ImportError:  # python 2
+    from urllib import urlencode
+
+from wunderpy.api.codec import JSONCodec
 
 
 API_URL = "https://api.wunderlist.com"
 COMMENTS_URL = "https://comments.wunderlist.com"
 
 
-def batch(ops):
-    '''Make a Request for a batch call.
+def _to_bytes(encoded):
+    if isinstance(encoded, bytes):
+        return encoded
+    return encoded.encode("utf-8")
+
+
+_json = JSONCodec()
+
+
+class Operation(object):
+    '''One call to the API: a method, a path on a host, query parameters
+    and a JSON body.
+
+    Its body is encoded the first time it is sent and reused from then
+    on, when it is retried or sent again as part of a /batch call.
+    Don't change data once it has been sent.
+    '''
 
-    :param ops: a list of pre-formatted requests
-    :returns: Request
+    __slots__ = ("method", "path", "data", "host", "query", "_encoded")
+
+    def __init__(self, method, path, data=None, host=None, query=None):
+        '''
+        :param method: The HTTP method.
+        :type method: str
+        :param path: The path, relative to host.
+        :type path: str
+        :param data: The JSON body, or None for an empty object.
+        :type data: dict or None
+        :param host: The host, if not API_URL (e.g. COMMENTS_URL).
+        :type host: str or None
+        :param query: Query parameters, as (name, value) pairs.
+        :type query: list or None
+        '''
+
+        self.method = method
+        self.path = path
+        self.data = data
+        self.host = host
+        self.query = query
+        self._encoded = None  # (codec name, body, batch op)
+
+    def __repr__(self):
+        return "<wunderpy.api.calls.Operation: {} {}>".format(self.method,
+                                                            self.url)
+
+    @property
+    def target(self):
+        '''The path with the query string, if any.'''
+
+        if not self.query:
+            return self.path
+        return "{}?{}".format(self.path, urlencode(self.query))
+
+    @property
+    def url(self):
+        '''The absolute URL.'''
+
+        return (self.host or API_URL) + self.target
+
+    def _encode(self, codec):
+        if self._encoded is None or self._encoded[0] != codec.name:
+            body = _to_bytes(codec.dumps(self.data or {}))
+            # the path is all /batch needs, except on other hosts
+            url = self.url if self.host else self.target
+            op = b"".join([b'{"method": ', _to_bytes(codec.dumps(self.method)),
+                           b', "url": ', _to_bytes(codec.dumps(url)),
+                           b', "params": ', body, b"}"])
+            self._encoded = (codec.name, body, op)
+        return self._encoded
+
+    def body(self, codec=_json):
+        '''Return the encoded body.
+
+        :param codec: Defaults to the standard json module.
+        :type codec: JSONCodec
+        :returns: bytes
+        '''
+
+        return self._encode(codec)[1]
+
+    def batch_op(self, codec=_json):
+        '''Return the encoded op for a /batch call's ops.
+
+        :returns: bytes
+        '''
+
+        return self._encode(codec)[2]
+
+
+class BatchOperation(Operation):
+    '''A /batch call, its body is joined from its ops' encoded forms.'''
+
+    __slots__ = ("ops", "sequential")
+
+    def __init__(self, ops, sequential=True):
+        Operation.__init__(self, "POST", "/batch")
+        self.ops = ops
+        self.sequential = sequential
+
+    def _encode(self, codec):
+        if self._encoded is None or self._encoded[0] != codec.name:
+            ops = b", ".join(op.batch_op(codec) for op in self.ops)
+            body = b"".join([b'{"ops": [', ops, b'], "sequential": ',
+                             b"true" if self.sequential else b"false", b"}"])
+            self._encoded = (codec.name, body, None)
+        return self._encoded
+
+
+def batch(ops, sequential=True):
+    '''Make an Operation for a batch call.
+
+    :param ops: The Operations to send in it.
+    :type ops: list
+    :param sequential: Whether the server must run the ops in order.
+    :type sequential: bool
+    :returns: BatchOperation
     '''
 
-    request_body = {"ops": ops, "sequential": True}
-    return Request("POST", "{}/batch".format(API_URL), data=request_body)
+    return BatchOperation(ops, sequential)
 
 
 def login(email, password):
     '''Login request, so we can get a token.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("POST", "{}/login".format(API_URL),
-                   data={"email": email, "password": password})
+    return Operation("POST", "/login",
+                     data={"email": email, "password": password})
 
 
 def me():
-    '''Request for /me, which returns user information.
+    '''Operation for /me, which returns user information.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me".format(API_URL))
+    return Operation("GET", "/me")
 
 
-def get_all_tasks():
+def get_all_tasks(page=None, per_page=None):
     '''Get every task associated with the account.
 
-    :returns: Request
+    :param page: With per_page, which page of tasks to get, from 1.
+    :type page: int or None
+    :param per_page: Tasks per page, or None for all of them at once.
+    :type per_page: int or None
+    :returns: Operation
+    '''
+
+    if per_page is None:
+        return Operation("GET", "/me/tasks")
+    return Operation("GET", "/me/tasks",
+                     query=[("page", page or 1), ("per_page", per_page)])
+
+
+def get_list_tasks(list_id):
+    '''Get the tasks of one list.
+
+    :param list_id: The list's id, or "inbox".
+    :type list_id: str
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/tasks".format(API_URL))
+    return Operation("GET", "/{}/tasks".format(list_id))
 
 
 def add_task(title, list_id, due_date=None, starred=False):
@@ -60,7 +194,7 @@ def add_task(title, list_id, due_date=None, starred=False):
     :type due_date: str
     :param starred: Whether the task should be starred.
     :type starred: bool
-    :returns: Request
+    :returns: Operation
     '''
 
     if starred:
@@ -72,7 +206,7 @@ def add_task(title, list_id, due_date=None, starred=False):
     if due_date:
         body["due_date"] = due_date  # should be in ISO format
 
-    return Request("POST", "{}/me/tasks".format(API_URL), data=body)
+    return Operation("POST", "/me/tasks", data=body)
 
 
 def complete_task(task_id, completed_at=None):
@@ -87,9 +221,9 @@ def complete_task(task_id, completed_at=None):
     if not completed_at:
         completed_at = datetime.datetime.now().isoformat()
 
-    url = "{}/{}".format(API_URL, task_id)
+    url = "/{}".format(task_id)
     body = {"completed_at": completed_at, "position": 0}
-    return Request("PUT", url, data=body)
+    return Operation("PUT", url, data=body)
 
 
 def set_note_for_task(note, task_id):
@@ -99,12 +233,12 @@ def set_note_for_task(note, task_id):
     :type note: str
     :param task_id: The id of the task.
     :type task_id: str
-    :returns: Request
+    :returns: Operation
     '''
 
-    url = "{}/{}".format(API_URL, task_id)
+    url = "/{}".format(task_id)
     body = {"note": note}
-    return Request("PUT", url, data=body)
+    return Operation("PUT", url, data=body)
 
 
 def set_title_for_task(task_id, title):
@@ -114,12 +248,12 @@ def set_title_for_task(task_id, title):
     :type task_id: str
     :param title: The title's contents.
     :type title: str
-    :returns: Request
+    :returns: Operation
     '''
 
-    url = "{}/{}".format(API_URL, task_id)
+    url = "/{}".format(task_id)
     body = {"title": title}
-    return Request("PUT", url, data=body)
+    return Operation("PUT", url, data=body)
 
 def set_task_due_date(task_id, due_date, recurrence_count=1):
     '''Set a task's due date.
@@ -130,12 +264,12 @@ def set_task_due_date(task_id, due_date, recurrence_count=1):
     :type due_date: str
     :param recurrence_count: Not completely sure yet.
     :type recurrence_count: int
-    :returns: Request
+    :returns: Operation
     '''
 
-    url = "{}/{}".format(API_URL, task_id)
+    url = "/{}".format(task_id)
     body = {"due_date": due_date, "recurrence_count": recurrence_count}
-    return Request("PUT", url, data=body)
+    return Operation("PUT", url, data=body)
 
 
 def delete_task(task_id, deleted_at=None):
@@ -143,24 +277,24 @@ def delete_task(task_id, deleted_at=None):
 
     :param task_id: The task's id.
     :type task_id: str
-    :returns: Request
+    :returns: Operation
     '''
 
     if not deleted_at:
         deleted_at = datetime.datetime.now().isoformat()
 
-    url = "{}/{}".format(API_URL, task_id)
+    url = "/{}".format(task_id)
     body = {"deleted_at": deleted_at}
-    return Request("DELETE", url, data=body)
+    return Operation("DELETE", url, data=body)
 
 
 def get_lists():
     '''Get all of the task lists
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/lists".format(API_URL))
+    return Operation("GET", "/me/lists")
 
 
 def add_list(list_name):
@@ -168,11 +302,11 @@ def add_list(list_name):
 
     :param list_name: The name of the new list.
     :type list_name: str
-    :returns: Request
+    :returns: Operation
     '''
 
     body = {"title": list_name}
-    return Request("POST", "{}/me/lists".format(API_URL), data=body)
+    return Operation("POST", "/me/lists", data=body)
 
 
 def delete_list(list_id):
@@ -180,11 +314,11 @@ def delete_list(list_id):
 
     :param list_id: The id of the list to delete.
     :type list_id: str
-    :returns: Request
+    :returns: Operation
     '''
 
-    url = "{}/{}".format(API_URL, list_id)
-    return Request("DELETE", url)
+    url = "/{}".format(list_id)
+    return Operation("DELETE", url)
 
 
 def get_comments(task_id):
@@ -194,8 +328,8 @@ def get_comments(task_id):
     :type task_id: str
     '''
 
-    url = "{}/tasks/{}/messages".format(COMMENTS_URL, task_id)
-    return Request("GET", url)
+    url = "/tasks/{}/messages".format(task_id)
+    return Operation("GET", url, host=COMMENTS_URL)
 
 
 def add_comment(title, task_id):
@@ -205,22 +339,22 @@ def add_comment(title, task_id):
     :param task_id: The ID of the task you're commenting on.
     :type title: str
     :type task_id: str
-    :returns: Request
+    :returns: Operation
     '''
 
-    url = "{}/tasks/{}/messages".format(COMMENTS_URL, task_id)
+    url = "/tasks/{}/messages".format(task_id)
     body = {"channel_id": task_id, "channel_type": "tasks",
             "text": title}
-    return Request("POST", url, data=body)
+    return Operation("POST", url, data=body, host=COMMENTS_URL)
 
 
 def get_reminders():
     '''Get a list of all reminders.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/reminders".format(API_URL))
+    return Operation("GET", "/me/reminders")
 
 
 def set_reminder_for_task(task_id, date):
@@ -230,62 +364,62 @@ def set_reminder_for_task(task_id, date):
     :type task_id: str
     :param date: The reminder date/time in ISO format.
     :type date: str
-    :returns: Request
+    :returns: Operation
     '''
 
     body = {"task_id": task_id, "date": date}  # date is in ISO date format
-    return Request("POST", "{}/me/reminders".format(API_URL), data=body)
+    return Operation("POST", "/me/reminders", data=body)
 
 
 def get_shares():
     '''Get a list of all things shared with you, I think...
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/shares".format(API_URL))
+    return Operation("GET", "/me/shares")
 
 
 def get_services():
     '''Not sure.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/services".format(API_URL))
+    return Operation("GET", "/me/services")
 
 
 def get_events():
     '''Not sure.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/events".format(API_URL))
+    return Operation("GET", "/me/events")
 
 
 def get_settings():
     '''Get account settings.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/settings".format(API_URL))
+    return Operation("GET", "/me/settings")
 
 
 def get_friends():
     '''Get friends list.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/friends".format(API_URL))
+    return Operation("GET", "/me/friends")
 
 
 def get_quota():
     '''Get your account's quota.
 
-    :returns: Request
+    :returns: Operation
     '''
 
-    return Request("GET", "{}/me/quota".format(API_URL))
+    return Operation("GET", "/me/quota")
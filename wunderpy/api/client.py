@@ -1,32 +1,145 @@
 '''Facilities for a client that only sends requests to the Wunderlist API'''
 
 
-import json
 import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
-from requests import Session
+from requests import Session, ConnectionError, ConnectTimeout
+from requests import PreparedRequest
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
 
-from wunderpy.api.calls import batch, API_URL
+from wunderpy.api.calls import batch, BatchOperation, API_URL, COMMENTS_URL
 from wunderpy.api.calls import login as login_call
+from wunderpy.api.stream import iter_array
+from wunderpy.api.retry import RetryPolicy
+from wunderpy.api.cache import CacheEntry
+from wunderpy.api.codec import JSONCodec, get_codec
+from wunderpy.api.metrics import RequestEvent
 
 
-def batch_format(request):
-    '''Make a dict compatible with wunderlist's batch endpoint.'''
+#: The outcome of one op in a /batch call. error is None if it succeeded.
+BatchResult = namedtuple("BatchResult", ["status", "body", "error"])
 
-    request.url = request.url.replace(API_URL, "")
 
-    op = {"method": request.method, "url": request.url,
-          "params": request.data}
-    return op
+def batch_result(response):
+    '''Make a BatchResult from one item of a /batch response's results.'''
+
+    status = response["status"]
+    body = response.get("body")
+    if status < 300:  # /batch is always 200
+        return BatchResult(status, body, None)
+    return BatchResult(status, body, Exception(status, body))
+
+
+def request_sent(error):
+    '''Whether a request that failed with a ConnectionError may have
+    reached the server, i.e. it didn't fail while connecting.'''
+
+    if isinstance(error, ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+def is_write(request):
+    '''Whether an Operation changes anything on the server. A /batch call
+    is a POST, but only writes if one of its ops does.'''
+
+    if isinstance(request, BatchOperation):
+        return any(is_write(op) for op in request.ops)
+    return request.method not in ("GET", "HEAD")
+
+
+def chunked(items, size):
+    '''Split a list into consecutive lists of at most size items.'''
+
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def make_session(pool_connections=10, pool_maxsize=10, pool_block=False,
+                 max_retries=0, keep_alive=True):
+    '''Make a Session with a tuned connection pool for each Wunderlist host.
+
+    The API and comments hosts each get their own adapter, so one can't
+    starve the other. A Session can be shared by several APIClients.
+
+    :param pool_connections: Number of per-host pools to cache.
+    :type pool_connections: int
+    :param pool_maxsize: Maximum connections kept open per host.
+    :type pool_maxsize: int
+    :param pool_block: Wait for a free connection instead of opening
+                       more than pool_maxsize.
+    :type pool_block: bool
+    :param max_retries: Retries for failed connections (not for HTTP errors).
+    :type max_retries: int
+    :param keep_alive: Reuse connections between requests.
+    :type keep_alive: bool
+    :returns: Session
+    '''
+
+    session = Session()
+    for url in (API_URL, COMMENTS_URL):
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block, max_retries=max_retries)
+        session.mount(url, adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
 
 
 class APIClient(object):
     '''A class implementing all of the features needed to talk to Wunderlist'''
-    def __init__(self):
-        self.session = Session()
+
+    #: Most ops sent in one /batch call, send_requests splits bigger batches.
+    batch_size = 50
+    #: Most /batch calls send_requests makes at once when not sequential.
+    batch_workers = 4
+
+    def __init__(self, session=None, retry_policy=None, rate_limiter=None,
+                 response_cache=None, codec=None, hooks=None, **pool_options):
+        '''
+        :param session: A Session to send requests with, e.g. one from
+                        make_session shared with other clients.
+        :type session: Session or None
+        :param retry_policy: When to resend failed requests, including
+                             /batch calls. Defaults to RetryPolicy().
+        :type retry_policy: RetryPolicy or None
+        :param rate_limiter: Consulted before sending anything, may be
+                             shared with other clients.
+        :type rate_limiter: RateLimiter or None
+        :param response_cache: Revalidate GET requests sent with
+                               send_request instead of downloading them
+                               again, may be shared with other clients.
+        :type response_cache: ResponseCache or None
+        :param codec: JSON codec for bodies, or the name of one. Defaults
+                      to the fastest installed, see get_codec.
+        :type codec: JSONCodec, str or None
+        :param hooks: Told about every request, e.g. a MetricsHook.
+        :type hooks: list of Hook or None
+        :param pool_options: Passed to make_session if no session is given.
+        '''
+
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        if not isinstance(codec, JSONCodec):
+            codec = get_codec(codec)
+        self.codec = codec
+        self.hooks = list(hooks or [])
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+
+        if session is None:
+            session = make_session(**pool_options)
+        self.session = session
         self.token = None
         self.id = None
         self.headers = {"Content-Type": "application/json"}
+        self.last_write = None  # when the last write succeeded
 
     def login(self, email, password):
         '''Login to wunderlist'''
@@ -43,53 +156,250 @@ class APIClient(object):
     def send_request(self, request, timeout=30):
         '''Send a single request to Wunderlist in real time.
 
-        :param request: A prepared Request object for the request.
-        :type request_method: Request
+        :param request: An Operation from wunderpy.api.calls.
+        :type request: Operation
         :param timeout: Timeout duration in seconds.
         :type timeout: int
         :returns: dict:
         '''
 
-        request.headers = self.headers
+        event = RequestEvent(request)
+        cached = None
+        validators = {}
+        if self.response_cache is not None and request.method == "GET":
+            key = self.response_cache.key(self.token, request.url)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                if cached.etag:
+                    validators["If-None-Match"] = cached.etag
+                if cached.last_modified:
+                    validators["If-Modified-Since"] = cached.last_modified
+
+        r = self._send(request, timeout, headers=validators, event=event)
+        content = r.content
+        event.bytes_received = len(content)
+        self._received(event)
+        if r.status_code == 304:  # only sent when we have validators
+            return cached.body
+
+        body = self.codec.loads(content)
+        if self.response_cache is not None and request.method == "GET":
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.response_cache.set(key, CacheEntry(etag, last_modified,
+                                                        body))
+        return body
+
+    def _send(self, request, timeout=30, stream=False, headers=None,
+              event=None):
+        '''Send a request and return the successful (or 304) Response.
+
+        :param stream: Don't download the body yet.
+        :type stream: bool
+        :param headers: Extra headers for this request only.
+        :type headers: dict or None
+        :param event: Tells the hooks about each attempt.
+        :type event: RequestEvent or None
+        :returns: requests.Response
+        '''
+
+        if event is None:
+            event = RequestEvent(request)
+
         # Include the session headers in the request
-        request.headers.update(self.session.headers)
-        if request.data == []:
-            request.data = json.dumps({})
-        else:
-            request.data = json.dumps(request.data)
+        request_headers = dict(self.session.headers, **self.headers)
+        request_headers.update(headers or {})
 
-        r = self.session.send(request.prepare(), timeout=timeout)
+        prepared = PreparedRequest()
+        prepared.prepare_method(request.method)
+        prepared.prepare_url(request.url, None)
+        prepared.prepare_headers(request_headers)
+        prepared.prepare_body(request.body(self.codec), None)
+        event.bytes_sent = len(prepared.body)
 
-        if r.status_code < 300:
-            return r.json()
-        elif r.status_code == 404:  # dirty hack around this timing bullshit
-            time.sleep(1)
-            r2 = self.session.send(request.prepare(), timeout=timeout)
-            if r2.status_code == 404:  # still doesn't work
-                raise Exception(r2.status_code, r2)
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(self.token)
+            event.attempts = attempt
+            self._emit("before_send", event)
+            try:
+                r = self.session.send(prepared, timeout=timeout,
+                                      stream=stream)
+            except ConnectionError as e:  # refused, reset...
+                delay = self.retry_policy.next_delay(
+                    attempt, time.time() - started, method=request.method,
+                    sent=request_sent(e), since_write=self._since_write())
+                self._failed(event, None, e, delay is not None)
+                if delay is None:
+                    raise
             else:
-                return r2.json()
-        else:
-            raise Exception(r.status_code, r)
+                if r.status_code < 300 or r.status_code == 304:
+                    event.status = r.status_code
+                    self._succeeded(request)
+                    return r
+                delay = self.retry_policy.next_delay(
+                    attempt, time.time() - started, r.status_code,
+                    r.headers.get("Retry-After"), request.method,
+                    since_write=self._since_write())
+                error = Exception(r.status_code, r)
+                self._failed(event, r.status_code, error, delay is not None)
+                if delay is None:
+                    raise error
+                r.close()
+            time.sleep(delay)
+
+    def _since_write(self):
+        if self.last_write is None:
+            return None
+        return time.time() - self.last_write
+
+    def _succeeded(self, request):
+        if is_write(request):
+            self.last_write = time.time()
+
+    def _emit(self, name, *args):
+        for hook in self.hooks:
+            getattr(hook, name)(*args)
 
-    def send_requests(self, api_requests, timeout=30):
+    def _failed(self, event, status, error, retrying):
+        event.status = status
+        event.error = error
+        event.elapsed = time.time() - event.started
+        self._emit("on_error", event, retrying)
+
+    def _received(self, event):
+        '''Tell the hooks a response has been read, after its body.'''
+
+        event.elapsed = time.time() - event.started
+        self._emit("after_receive", event)
+
+    def send_requests(self, api_requests, timeout=30, sequential=True):
         '''Sends requests as a batch.
 
         Returns a generator which will yield the server response for each
         request in the order they were supplied.
         You must run next() on the result at least once.
 
-        :param api_requests: a list of valid, prepared Request objects.
-        :type api_requests: list -- Made up of requests.Request objects
+        Requests are sent in /batch calls of at most batch_size ops. If
+        sequential is False, the server may run them in any order and up to
+        batch_workers of those calls are made in parallel. The responses
+        are yielded in order either way.
+
+        The first failed request raises an Exception, use stream_requests
+        to get the results of the others too. Each /batch response is
+        decoded whole, with the codec.
+
+        :param api_requests: Operations from wunderpy.api.calls.
+        :type api_requests: list
+        :param sequential: Whether the requests must run in order.
+        :type sequential: bool
         :yields: dict
         '''
 
-        ops = [batch_format(req) for req in api_requests]
+        for result in self._batch_results(api_requests, timeout, sequential,
+                                          stream=False):
+            if result.error is not None:
+                raise result.error
+            yield result.body
 
-        batch_request = batch(ops)
-        responses = self.send_request(batch_request)
-        for response in responses["results"]:
-            if response["status"] < 300:  # /batch is always 200
-                yield response["body"]
-            else:
-                raise Exception(response["status"])
+    def stream_requests(self, api_requests, timeout=30, sequential=True):
+        '''Sends requests as a batch, yielding a BatchResult for each.
+
+        Like send_requests, but a failed request doesn't stop the others:
+        its BatchResult has the status and an error instead. Results are
+        decoded from the response as it is downloaded, so memory use stays
+        flat however big the batch is.
+
+        :param api_requests: Operations from wunderpy.api.calls.
+        :type api_requests: list
+        :param sequential: Whether the requests must run in order.
+        :type sequential: bool
+        :yields: BatchResult
+        '''
+
+        return self._batch_results(api_requests, timeout, sequential,
+                                   stream=True)
+
+    def _batch_results(self, api_requests, timeout, sequential, stream):
+        '''Send requests in /batch calls, yield a BatchResult for each.
+
+        :param stream: Decode each /batch response as it is downloaded,
+                       rather than all at once with the codec.
+        :type stream: bool
+        '''
+
+        batches = [batch(chunk, sequential)
+                   for chunk in chunked(api_requests, self.batch_size)]
+
+        def read_batch(batch_request):
+            return self._read_batch(batch_request, timeout)
+
+        pool = None
+        if not sequential and self.batch_workers > 1 and len(batches) > 1:
+            # parallel batches are read in the pool, they can't be streamed
+            pool = ThreadPool(min(self.batch_workers, len(batches)))
+            responses = pool.imap(read_batch, batches)  # keeps the order
+        elif stream:  # one at a time
+            responses = (self._stream_batch(b, timeout) for b in batches)
+        else:
+            responses = (read_batch(b) for b in batches)
+
+        try:
+            for batch_responses in responses:
+                for response in batch_responses:
+                    yield batch_result(response)
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def stream_request(self, request, timeout=30):
+        '''Send a single request whose response is a JSON array.
+
+        The items are decoded as the response is downloaded, so only one
+        of them is in memory at a time. The response_cache isn't used.
+
+        :param request: An Operation from wunderpy.api.calls, e.g.
+                        calls.get_all_tasks().
+        :type request: Operation
+        :param timeout: Timeout duration in seconds.
+        :type timeout: int
+        :yields: dict
+        '''
+
+        return self._stream_array(request, timeout)
+
+    def _read_batch(self, batch_request, timeout):
+        '''Send one /batch call, return its results.'''
+
+        event = RequestEvent(batch_request)
+        r = self._send(batch_request, timeout, event=event)
+        content = r.content
+        event.bytes_received = len(content)
+        self._received(event)
+        return self.codec.loads(content)["results"]
+
+    def _stream_batch(self, batch_request, timeout):
+        '''Send one /batch call, yield each item of its results.'''
+
+        return self._stream_array(batch_request, timeout, "results")
+
+    def _stream_array(self, request, timeout, key=None):
+        '''Send a request, yield each item of the array in its response.'''
+
+        event = RequestEvent(request)
+        r = self._send(request, timeout, stream=True, event=event)
+
+        def chunks():
+            for chunk in r.iter_content(8192):
+                event.bytes_received += len(chunk)
+                yield chunk
+        try:
+            for item in iter_array(chunks(), key):
+                yield item
+        finally:
+            r.close()
+        self._received(event)
@@ -0,0 +1,93 @@
+'''JSON codecs for request and response bodies.
+
+orjson or ujson are used when installed, they are much faster than the
+json module on big responses like /me/tasks. Every codec decodes straight
+from the response's bytes.
+'''
+
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec(object):
+    '''Encodes and decodes JSON with the standard json module.'''
+
+    name = "json"
+
+    def dumps(self, obj):
+        '''Encode obj as a request body.
+
+        :returns: str or bytes
+        '''
+
+        return json.dumps(obj)
+
+    def loads(self, data):
+        '''Decode a response body.
+
+        :param data: The body as it came off the wire.
+        :type data: bytes
+        '''
+
+        if isinstance(data, bytes):  # json only takes bytes from 3.6
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    '''Encodes and decodes JSON with orjson.'''
+
+    name = "orjson"
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    '''Encodes and decodes JSON with ujson.'''
+
+    name = "ujson"
+
+    def dumps(self, obj):
+        return ujson.dumps(obj)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+CODECS = {"json": JSONCodec, "orjson": OrjsonCodec, "ujson": UjsonCodec}
+AVAILABLE = {"json": True, "orjson": orjson is not None,
+             "ujson": ujson is not None}
+
+
+def get_codec(name=None):
+    '''Return a codec by name, or the fastest one installed.
+
+    :param name: "json", "orjson", "ujson" or None.
+    :type name: str or None
+    :returns: JSONCodec
+    :raises: ValueError if the codec is unknown or its module missing.
+    '''
+
+    if name is None:
+        for name in ("orjson", "ujson", "json"):
+            if AVAILABLE[name]:
+                break
+    if name not in CODECS:
+        raise ValueError("Unknown JSON codec {!r}".format(name))
+    if not AVAILABLE[name]:
+        raise ValueError("{} isn't installed".format(name))
+    return CODECS[name]()
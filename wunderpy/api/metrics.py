@@ -0,0 +1,268 @@
+'''Instrumentation of API requests: hooks, metrics and exporters.
+
+Give APIClient a list of Hooks and each is told about every request
+before each attempt, when it fails and once its response has been read.
+MetricsHook keeps per-endpoint counters and latency histograms, which
+can be written out in the Prometheus text format, and StatsDHook sends
+StatsD lines over UDP.
+'''
+
+
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+
+
+#: Path segments that aren't ids.
+STATIC_SEGMENTS = frozenset(["me", "tasks", "lists", "batch", "login",
+                             "reminders", "shares", "services", "events",
+                             "settings", "friends", "quota", "messages"])
+
+#: Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+def endpoint(request):
+    '''Name the endpoint of an Operation, with ids replaced by :id.
+
+    e.g. "PUT /:id" or "GET /tasks/:id/messages".
+    '''
+
+    segments = [segment if segment in STATIC_SEGMENTS else ":id"
+                for segment in request.path.split("/")[1:]]
+    return "{} /{}".format(request.method, "/".join(segments))
+
+
+class RequestEvent(object):
+    '''One request as the hooks see it, updated as it goes.'''
+
+    __slots__ = ("request", "endpoint", "started", "attempts", "status",
+                 "error", "bytes_sent", "bytes_received", "elapsed")
+
+    def __init__(self, request):
+        '''
+        :param request: The request being sent.
+        :type request: Operation
+        '''
+
+        self.request = request
+        self.endpoint = endpoint(request)
+        self.started = time.time()
+        self.attempts = 0
+        self.status = None  # of the last response, None if none came
+        self.error = None  # of the last failed attempt
+        self.bytes_sent = 0  # per attempt
+        self.bytes_received = 0  # the body of the final response
+        self.elapsed = None  # seconds since the first attempt
+
+
+class Hook(object):
+    '''Base class for instrumentation hooks, every method does nothing.
+
+    Hooks are called from whichever thread sends the request.
+    '''
+
+    def before_send(self, event):
+        '''Called before each attempt, event.attempts counts from 1.'''
+
+    def after_receive(self, event):
+        '''Called once the successful response's body has been read.'''
+
+    def on_error(self, event, retrying):
+        '''Called after each failed attempt.
+
+        :param event: Has the error and, if a response came, its status.
+        :type event: RequestEvent
+        :param retrying: Whether the request will be sent again.
+        :type retrying: bool
+        '''
+
+
+class EndpointMetrics(object):
+    '''Counters and a latency histogram for one endpoint.'''
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        # one more than LATENCY_BUCKETS, for anything slower
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.latency_sum += seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    @property
+    def mean_latency(self):
+        observed = sum(self.buckets)
+        return self.latency_sum / observed if observed else 0.0
+
+
+class MetricsHook(Hook):
+    '''Collects per-endpoint metrics. Safe to share between clients.'''
+
+    def __init__(self, prefix="wunderpy"):
+        '''
+        :param prefix: Prefix of the exported metric names.
+        :type prefix: str
+        '''
+
+        self.prefix = prefix
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def _metrics(self, name):
+        metrics = self.endpoints.get(name)
+        if metrics is None:
+            metrics = self.endpoints[name] = EndpointMetrics()
+        return metrics
+
+    def before_send(self, event):
+        if event.attempts > 1:
+            with self.lock:
+                self._metrics(event.endpoint).retries += 1
+
+    def after_receive(self, event):
+        with self.lock:
+            metrics = self._metrics(event.endpoint)
+            metrics.requests += 1
+            metrics.bytes_sent += event.bytes_sent * event.attempts
+            metrics.bytes_received += event.bytes_received
+            metrics.observe(event.elapsed)
+
+    def on_error(self, event, retrying):
+        if not retrying:
+            with self.lock:
+                metrics = self._metrics(event.endpoint)
+                metrics.requests += 1
+                metrics.errors += 1
+                metrics.bytes_sent += event.bytes_sent * event.attempts
+                metrics.observe(event.elapsed)
+
+    def slowest(self, count=5):
+        '''Return the (endpoint, mean latency) of the slowest endpoints.'''
+
+        with self.lock:
+            latencies = [(name, metrics.mean_latency)
+                         for name, metrics in self.endpoints.items()]
+        latencies.sort(key=lambda latency: latency[1], reverse=True)
+        return latencies[:count]
+
+    def prometheus_text(self):
+        '''Return every metric in the Prometheus text exposition format.'''
+
+        prefix = self.prefix
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+
+            name = "{}_request_duration_seconds".format(prefix)
+            lines.append("# HELP {} Time until the response was read.".format(
+                name))
+            lines.append("# TYPE {} histogram".format(name))
+            bounds = [repr(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+            for label, metrics in endpoints:
+                label = _escape(label)
+                cumulative = 0
+                for bound, count in zip(bounds, metrics.buckets):
+                    cumulative += count
+                    lines.append('{}_bucket{{endpoint="{}",le="{}"}} {}'
+                                 .format(name, label, bound, cumulative))
+                lines.append('{}_sum{{endpoint="{}"}} {!r}'.format(
+                    name, label, metrics.latency_sum))
+                lines.append('{}_count{{endpoint="{}"}} {}'.format(
+                    name, label, cumulative))
+
+            for counter, help_text in (
+                    ("requests", "Requests made."),
+                    ("errors", "Requests that failed for good."),
+                    ("retries", "Attempts after the first."),
+                    ("bytes_sent", "Request body bytes sent."),
+                    ("bytes_received", "Response body bytes read.")):
+                name = "{}_{}_total".format(prefix, counter)
+                lines.append("# HELP {} {}".format(name, help_text))
+                lines.append("# TYPE {} counter".format(name))
+                for label, metrics in endpoints:
+                    lines.append('{}{{endpoint="{}"}} {}'.format(
+                        name, _escape(label), getattr(metrics, counter)))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        '''Write prometheus_text to a file, e.g. for node_exporter's
+        textfile collector. Readers never see half a file.
+        '''
+
+        tmp_path = "{}.{}".format(path, os.getpid())
+        with open(tmp_path, "w") as sink:
+            sink.write(self.prometheus_text())
+        os.rename(tmp_path, path)
+
+
+def _escape(label):
+    return label.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class StatsDHook(Hook):
+    '''Sends StatsD lines over UDP as requests finish.
+
+    Sending never blocks or raises, lost lines are simply lost.
+    '''
+
+    def __init__(self, host="127.0.0.1", port=8125, prefix="wunderpy"):
+        '''
+        :param host: Where the StatsD daemon listens.
+        :type host: str
+        :param port: Its UDP port.
+        :type port: int
+        :param prefix: Prefix of the metric names.
+        :type prefix: str
+        '''
+
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def _name(self, event):
+        # "PUT /:id" becomes wunderpy.PUT.id
+        parts = event.endpoint.replace(":", "").replace(" /", "/").split("/")
+        return ".".join([self.prefix] + [part for part in parts if part])
+
+    def lines(self, event, error=False, retrying=False):
+        '''Return the StatsD lines for a finished or failed request.'''
+
+        name = self._name(event)
+        if retrying:
+            return ["{}.retries:1|c".format(name)]
+        lines = ["{}.requests:1|c".format(name),
+                 "{}.latency:{:.3f}|ms".format(name, event.elapsed * 1000),
+                 "{}.bytes_sent:{}|c".format(
+                     name, event.bytes_sent * event.attempts)]
+        if error:
+            lines.append("{}.errors:1|c".format(name))
+        else:
+            lines.append("{}.bytes_received:{}|c".format(
+                name, event.bytes_received))
+        return lines
+
+    def _send(self, lines):
+        try:
+            self.socket.sendto("\n".join(lines).encode("utf-8"),
+                               self.address)
+        except (socket.error, OSError):
+            pass
+
+    def after_receive(self, event):
+        self._send(self.lines(event))
+
+    def on_error(self, event, retrying):
+        self._send(self.lines(event, error=True, retrying=retrying))
+
+    def close(self):
+        self.socket.close()
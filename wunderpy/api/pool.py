@@ -0,0 +1,181 @@
+'''Implements the AccountPool class.'''
+
+
+from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from wunderpy.api.client import APIClient, make_session
+from wunderpy.api.cache import ResponseCache
+
+
+#: The outcome of a call for one account. error is None if it succeeded.
+AccountResult = namedtuple("AccountResult", ["token", "body", "error"])
+
+
+class AccountPool(object):
+    '''Clients for many accounts sharing one transport.
+
+    Every client sends through the same Session (so the same connection
+    pool), the same RateLimiter and the same ResponseCache, whose keys
+    include the token so accounts never see each other's responses.
+
+        pool = AccountPool(rate_limiter=RateLimiter(per_token_rate=5))
+        for token in tokens:
+            pool.add(token)
+        for result in pool.send_request_all(calls.get_all_tasks):
+            ...
+
+    Pass client_class=Wunderlist to hold a Wunderlist per account.
+    '''
+
+    def __init__(self, max_workers=8, client_class=APIClient, session=None,
+                 rate_limiter=None, response_cache=None, retry_policy=None,
+                 hooks=None, codec=None, **pool_options):
+        '''
+        :param max_workers: Most accounts called at once by the fan-out
+                            methods, the default Session keeps as many
+                            connections open.
+        :type max_workers: int
+        :param client_class: APIClient or a subclass, like Wunderlist.
+        :type client_class: type
+        :param session: See APIClient.
+        :type session: Session or None
+        :param rate_limiter: See APIClient.
+        :type rate_limiter: RateLimiter or None
+        :param response_cache: See APIClient, defaults to a new one.
+        :type response_cache: ResponseCache or None
+        :param retry_policy: See APIClient.
+        :type retry_policy: RetryPolicy or None
+        :param hooks: See APIClient.
+        :type hooks: list of Hook or None
+        :param codec: See APIClient.
+        :type codec: JSONCodec, str or None
+        :param pool_options: Passed to make_session if no session is given.
+        '''
+
+        if session is None:
+            pool_options.setdefault("pool_maxsize", max_workers)
+            session = make_session(**pool_options)
+        if response_cache is None:
+            response_cache = ResponseCache()
+
+        self.max_workers = max_workers
+        self.client_class = client_class
+        self.client_options = {"session": session,
+                               "rate_limiter": rate_limiter,
+                               "response_cache": response_cache,
+                               "retry_policy": retry_policy,
+                               "hooks": hooks, "codec": codec}
+        self.clients = OrderedDict()  # token: client
+
+    @property
+    def session(self):
+        return self.client_options["session"]
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __iter__(self):
+        return iter(self.clients.values())
+
+    def __contains__(self, token):
+        return token in self.clients
+
+    def add(self, token, **client_options):
+        '''Make a client for an account, or return the one it has.
+
+        :param token: The account's token, as from APIClient.login.
+        :type token: str
+        :param client_options: More arguments for client_class.
+        :returns: a client_class instance
+        '''
+
+        client = self.clients.get(token)
+        if client is None:
+            options = dict(self.client_options, **client_options)
+            client = self.client_class(**options)
+            client.set_token(token)
+            self.clients[token] = client
+        return client
+
+    def remove(self, token):
+        '''Forget an account's client.'''
+
+        del self.clients[token]
+
+    def client(self, token):
+        '''Return an account's client.
+
+        :raises: KeyError if the token wasn't added.
+        '''
+
+        return self.clients[token]
+
+    def map(self, func, tokens=None, max_workers=None):
+        '''Call func with the client of each account, concurrently.
+
+        :param func: Takes a client.
+        :type func: callable
+        :param tokens: Accounts to call it for, defaults to all of them.
+        :type tokens: list or None
+        :param max_workers: Most calls at once, defaults to max_workers.
+        :type max_workers: int or None
+        :yields: AccountResult, in the order of tokens. An exception from
+                 func is its error rather than raised.
+        '''
+
+        if tokens is None:
+            tokens = list(self.clients)
+        clients = [self.clients[token] for token in tokens]
+        workers = min(max_workers or self.max_workers, len(clients))
+
+        def call(client):
+            try:
+                return AccountResult(client.token, func(client), None)
+            except Exception as e:
+                return AccountResult(client.token, None, e)
+
+        if workers <= 1:
+            for client in clients:
+                yield call(client)
+            return
+
+        pool = ThreadPool(workers)
+        try:
+            for result in pool.imap(call, clients):  # keeps the order
+                yield result
+        finally:
+            pool.close()
+
+    def send_request_all(self, request, tokens=None, timeout=30,
+                         max_workers=None):
+        '''Send the same request for every account, concurrently.
+
+        :param request: A function from wunderpy.api.calls taking no
+                        arguments (e.g. calls.get_all_tasks), or an
+                        Operation to send as it is.
+        :type request: callable or Operation
+        :param tokens: See map.
+        :param max_workers: See map.
+        :yields: AccountResult with the response as its body
+        '''
+
+        def send(client):
+            operation = request() if callable(request) else request
+            return client.send_request(operation, timeout)
+        return self.map(send, tokens, max_workers)
+
+    def send_requests_all(self, requests, tokens=None, timeout=30,
+                          max_workers=None):
+        '''Send the same requests in a batch for every account.
+
+        :param requests: Functions from wunderpy.api.calls taking no
+                         arguments, or Operations.
+        :type requests: list
+        :yields: AccountResult with the list of responses as its body
+        '''
+
+        def send(client):
+            operations = [r() if callable(r) else r for r in requests]
+            return list(client.send_requests(operations, timeout))
+        return self.map(send, tokens, max_workers)
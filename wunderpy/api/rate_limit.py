@@ -0,0 +1,162 @@
+'''Client-side rate limiting with token buckets.'''
+
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    '''A token bucket refilling at rate tokens per second, up to capacity.
+
+    Callers reserve tokens and are told how long to wait for them, so the
+    bucket can go into debt: requests are spaced out in the order they
+    arrived rather than all retrying at once. Safe to share between
+    threads.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        '''
+        :param rate: Tokens added per second.
+        :type rate: float
+        :param capacity: Most tokens the bucket holds, i.e. the largest
+                         burst let through without waiting. Defaults to
+                         one second's worth.
+        :type capacity: float or None
+        '''
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None
+                              else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        '''Take tokens, returning how many seconds to wait before using them.'''
+
+        with self.lock:
+            self._refill(time.time())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def wait_time(self, tokens=1):
+        '''How long a reservation made now would have to wait.'''
+
+        with self.lock:
+            self._refill(time.time())
+            missing = tokens - self.tokens
+            return max(0.0, missing / self.rate)
+
+
+class RateLimiter(object):
+    '''Limits how fast requests are sent, overall and per account token.
+
+    One RateLimiter can be shared by any number of clients and threads.
+    '''
+
+    def __init__(self, rate=None, burst=None, per_token_rate=None,
+                 per_token_burst=None):
+        '''
+        :param rate: Requests per second across every client, or None.
+        :type rate: float or None
+        :param burst: Requests let through at once overall.
+        :type burst: float or None
+        :param per_token_rate: Requests per second for each account token,
+                               or None.
+        :type per_token_rate: float or None
+        :param per_token_burst: Requests let through at once per token.
+        :type per_token_burst: float or None
+        '''
+
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.per_token_rate = per_token_rate
+        self.per_token_burst = per_token_burst
+        self.token_buckets = {}
+        self.lock = threading.Lock()
+
+        # metrics
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.waiting = 0
+
+    def _buckets(self, token, create=True):
+        buckets = []
+        if self.bucket is not None:
+            buckets.append(self.bucket)
+        if self.per_token_rate:
+            with self.lock:
+                bucket = self.token_buckets.get(token)
+                if bucket is None and not create:
+                    return buckets
+                if bucket is None:
+                    bucket = TokenBucket(self.per_token_rate,
+                                         self.per_token_burst)
+                    self.token_buckets[token] = bucket
+            buckets.append(bucket)
+        return buckets
+
+    def reserve(self, token=None):
+        '''Reserve one request, returning how many seconds to wait first.
+
+        Use this directly when sleeping some other way, e.g. in asyncio.
+
+        :param token: The account token the request is sent with.
+        :type token: str or None
+        '''
+
+        delay = max([b.reserve() for b in self._buckets(token)] or [0.0])
+        with self.lock:
+            self.requests += 1
+            if delay > 0:
+                self.throttled += 1
+                self.total_wait += delay
+        return delay
+
+    def wait(self, token=None):
+        '''Block until one request may be sent.
+
+        :param token: The account token the request is sent with.
+        :type token: str or None
+        :returns: float -- seconds waited
+        '''
+
+        delay = self.reserve(token)
+        if delay > 0:
+            with self.lock:
+                self.waiting += 1
+            try:
+                time.sleep(delay)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+        return delay
+
+    def wait_time(self, token=None):
+        '''How long a request sent now with token would have to wait.'''
+
+        buckets = self._buckets(token, create=False)
+        return max([b.wait_time() for b in buckets] or [0.0])
+
+    def metrics(self):
+        '''Return a dict of counters about the limiter.
+
+        requests and throttled count reservations, total_wait is the sum of
+        their waits in seconds, waiting is the number of threads blocked in
+        wait right now and current_wait the wait a new request would get.
+        '''
+
+        with self.lock:
+            metrics = {"requests": self.requests,
+                       "throttled": self.throttled,
+                       "total_wait": self.total_wait,
+                       "waiting": self.waiting}
+        metrics["current_wait"] = self.wait_time()
+        return metrics
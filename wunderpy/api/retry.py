@@ -0,0 +1,134 @@
+'''Implements the RetryPolicy class.'''
+
+
+import calendar
+import email.utils
+import random
+import time
+
+
+#: 404 shows up right after a write, until the change has propagated.
+RETRY_STATUSES = frozenset([404, 429, 500, 502, 503, 504])
+
+#: Methods that can be sent twice without doing anything twice.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+def parse_retry_after(value):
+    '''Turn a Retry-After header into a number of seconds, or None.
+
+    :param value: Either a number of seconds or an HTTP date.
+    :type value: str or None
+    '''
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate(value)
+    if parsed is None:
+        return None
+    return max(0.0, calendar.timegm(parsed) - time.time())
+
+
+class RetryPolicy(object):
+    '''Decides whether and when a failed request is sent again.
+
+    Waits grow exponentially from backoff up to max_backoff, with full
+    jitter so many clients don't retry in lockstep. A Retry-After header
+    from the server is honoured instead when there is one.
+
+    A request that may already have been carried out is only resent if
+    its method is idempotent: a POST (like add_task or any /batch call)
+    is resent after a 429 or a connection that couldn't be made, but not
+    after a 5xx or a reset. A 404 is only resent shortly after a write,
+    while the write may not have propagated yet.
+    '''
+
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30.0,
+                 max_elapsed=60.0, statuses=RETRY_STATUSES,
+                 connection_errors=True, jitter=True, write_window=5.0):
+        '''
+        :param max_attempts: Most times to send a request, including the
+                             first. 1 disables retrying.
+        :type max_attempts: int
+        :param backoff: Wait before the first retry, in seconds.
+        :type backoff: float
+        :param max_backoff: Longest wait between two attempts.
+        :type max_backoff: float
+        :param max_elapsed: Give up rather than wait past this many
+                            seconds after the first attempt.
+        :type max_elapsed: float
+        :param statuses: HTTP status codes worth retrying.
+        :type statuses: set
+        :param connection_errors: Retry failed or reset connections.
+        :type connection_errors: bool
+        :param jitter: Wait a random time up to the backoff.
+        :type jitter: bool
+        :param write_window: Seconds after a write during which a 404 is
+                             worth retrying.
+        :type write_window: float
+        '''
+
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_elapsed = max_elapsed
+        self.statuses = frozenset(statuses)
+        self.connection_errors = connection_errors
+        self.jitter = jitter
+        self.write_window = write_window
+
+    def next_delay(self, attempt, elapsed, status=None, retry_after=None,
+                   method="GET", sent=True, since_write=None):
+        '''Return how long to wait before retrying, or None to give up.
+
+        :param attempt: How many times the request has been sent.
+        :type attempt: int
+        :param elapsed: Seconds since the first attempt was sent.
+        :type elapsed: float
+        :param status: The response's status code, None if the connection
+                       failed.
+        :type status: int or None
+        :param retry_after: The response's Retry-After header.
+        :type retry_after: str or None
+        :param method: The request's HTTP method.
+        :type method: str
+        :param sent: False if the connection failed before the request
+                     could be sent, so the server never saw it.
+        :type sent: bool
+        :param since_write: Seconds since the client's last successful
+                            write, None if it hasn't made one.
+        :type since_write: float or None
+        '''
+
+        if attempt >= self.max_attempts:
+            return None
+        idempotent = method in IDEMPOTENT_METHODS
+        if status is None:
+            if not self.connection_errors or (sent and not idempotent):
+                return None
+        elif status not in self.statuses:
+            return None
+        elif status == 404:
+            if since_write is None or since_write > self.write_window:
+                return None
+        elif status != 429 and not idempotent:  # it may have been done
+            return None
+
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self.max_backoff,
+                        self.backoff * 2 ** (attempt - 1))
+            if self.jitter:
+                delay = random.uniform(0, delay)
+
+        if elapsed + delay > self.max_elapsed:
+            return None
+        return delay
+
+
+#: Never retry.
+NO_RETRY = RetryPolicy(max_attempts=1)
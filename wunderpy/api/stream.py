@@ -0,0 +1,271 @@
+'''Incremental decoding of JSON arrays from a response body.'''
+
+
+import codecs
+import json
+import re
+
+
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+
+
+class ArrayDecoder(object):
+    '''Decode the items of a JSON array as its text arrives.
+
+    The array is either the whole document, or the value of one key in
+    the top-level object (like "results" in a /batch response). Only one
+    item needs to be held in memory at a time.
+
+    Each value is scanned once, keeping its bracket depth and whether it
+    is inside a string from one chunk to the next, and only decoded once
+    it is complete, so big items cost no more than small ones.
+    '''
+
+    def __init__(self, key=None):
+        '''
+        :param key: Key of the top-level object holding the array,
+                    or None if the document is the array.
+        :type key: str or None
+        '''
+
+        self.key = key
+        self.text = ""
+        self.position = 0
+        self.current_key = None
+        self.state = "object" if key is not None else "array"
+        self.bytes_decoder = codecs.getincrementaldecoder("utf-8")()
+
+        # the value being scanned, see _scan
+        self.scanning = False
+        self.pending = []  # its text from earlier chunks
+        self.value_start = 0
+        self.scan_position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.scalar = False
+
+    def feed(self, data):
+        '''Add more of the document.
+
+        :param data: The next part of the body.
+        :type data: bytes or str
+        :returns: list -- every item that could be completed
+        '''
+
+        if isinstance(data, bytes):
+            data = self.bytes_decoder.decode(data)
+        if self.scanning:
+            # set aside rather than copied along with every chunk
+            self.pending.append(self.text[self.value_start:])
+            self.value_start = self.scan_position = 0
+            self.text = data
+        else:
+            self.text = self.text[self.position:] + data
+        self.position = 0
+
+        items = []
+        while self._step(items):
+            pass
+        return items
+
+    def close(self):
+        '''Signal the end of the document.
+
+        :returns: list -- any items that were still pending
+        :raises: ValueError if the array wasn't complete.
+        '''
+
+        items = self.feed(self.bytes_decoder.decode(b"", True))
+        if self.state != "done":
+            raise ValueError("JSON document ended early ({})".format(
+                self.state))
+        return items
+
+    def _skip_whitespace(self):
+        '''Move past whitespace, return the next character or None.'''
+
+        text = self.text
+        while self.position < len(text) and text[self.position] in WHITESPACE:
+            self.position += 1
+        if self.position < len(text):
+            return text[self.position]
+        return None
+
+    def _decode_value(self):
+        '''Decode the value at the current position, or None if incomplete.'''
+
+        if not self.scanning:
+            self.scanning = True
+            self.value_start = self.scan_position = self.position
+            self.depth = 0
+            self.in_string = self.escaped = self.scalar = False
+            char = self.text[self.position]
+            if char == '"':
+                self.in_string = True
+                self.scan_position += 1
+            elif char in "[{":
+                self.depth = 1
+                self.scan_position += 1
+            else:  # a number, true, false or null
+                self.scalar = True
+
+        end = self._scan()
+        if end is None:
+            return None
+
+        self.scanning = False
+        if self.pending:
+            self.pending.append(self.text[self.value_start:end])
+            text, start = "".join(self.pending), 0
+            self.pending = []
+        else:
+            text, start = self.text, self.value_start
+        value = _decoder.raw_decode(text, start)[0]
+        self.position = end
+        return (value,)
+
+    def _scan(self):
+        '''Scan the value from where the last scan stopped.
+
+        :returns: int -- the position just past its end, or None if it
+                  goes on past the text so far.
+        '''
+
+        text = self.text
+        position = self.scan_position
+        end = None
+        while end is None:
+            if self.scalar:
+                match = _SCALAR_END.search(text, position)
+                if match is None:  # cut short, think of a number
+                    position = len(text)
+                    break
+                end = match.start()
+            elif self.escaped:
+                if position >= len(text):
+                    break
+                position += 1
+                self.escaped = False
+            elif self.in_string:
+                match = _STRING_END.search(text, position)
+                if match is None:
+                    position = len(text)
+                    break
+                position = match.end()
+                if match.group() == "\\":
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                    if self.depth == 0:
+                        end = position
+            else:
+                match = _STRUCTURE.search(text, position)
+                if match is None:
+                    position = len(text)
+                    break
+                position = match.end()
+                char = match.group()
+                if char == '"':
+                    self.in_string = True
+                elif char in "[{":
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        end = position
+        self.scan_position = position
+        return end
+
+    def _expect(self, char):
+        if self.text[self.position] != char:
+            raise ValueError("Expected {!r} at {!r}".format(
+                char, self.text[self.position:self.position + 20]))
+        self.position += 1
+
+    def _step(self, items):
+        '''Make one step through the document.
+
+        :returns: bool -- False if more text is needed.
+        '''
+
+        if self.state == "done":
+            return False
+        if self.scanning:  # carry on with the value
+            char = None
+        else:
+            char = self._skip_whitespace()
+            if char is None:
+                return False
+
+        if self.state == "object":
+            self._expect("{")
+            self.state = "key"
+        elif self.state == "key":
+            if char == "}":
+                raise ValueError("No {!r} key in JSON object".format(
+                    self.key))
+            if char == ",":
+                self.position += 1
+                return True
+            decoded = self._decode_value()
+            if decoded is None:
+                return False
+            self.current_key = decoded[0]
+            self.state = "colon"
+        elif self.state == "colon":
+            self._expect(":")
+            if self.current_key == self.key:
+                self.state = "array"
+            else:
+                self.state = "skip"
+        elif self.state == "skip":
+            if self._decode_value() is None:
+                return False
+            self.state = "key"
+        elif self.state == "array":
+            self._expect("[")
+            self.state = "first item"
+        elif self.state == "first item":
+            if char == "]":
+                self.position += 1
+                self.state = "done"
+            else:
+                self.state = "item"
+        elif self.state == "item":
+            decoded = self._decode_value()
+            if decoded is None:
+                return False
+            items.append(decoded[0])
+            self.state = "after item"
+        elif self.state == "after item":
+            if char == "]":
+                self.position += 1
+                self.state = "done"
+            else:
+                self._expect(",")
+                self.state = "item"
+        return True
+
+
+def iter_array(chunks, key=None):
+    '''Yield the items of a JSON array from an iterable of body chunks.
+
+    :param chunks: The body, e.g. Response.iter_content().
+    :type chunks: iterable of bytes or str
+    :param key: See ArrayDecoder.
+    :yields: every item of the array, in order
+    '''
+
+    decoder = ArrayDecoder(key)
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+    for item in decoder.close():
+        yield item
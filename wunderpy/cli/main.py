@@ -5,7 +5,8 @@ import argparse
 from datetime import date, timedelta
 
 from wunderpy import Wunderlist
-from .storage import get_token, setup
+from .storage import get_token, get_cache_ttl, setup
+from .storage import load_snapshot, save_snapshot
 import wunderpy.cli.colors as colors
 import wunderpy.cli.six as six
 
@@ -13,11 +14,19 @@ import wunderpy.cli.six as six
 class WunderlistCLI(object):
     '''Handles basic tasks performed by the CLI app.'''
 
-    def __init__(self):
+    def __init__(self, refresh=False, only_list=None):
+        '''
+        :param refresh: Ignore the local snapshot and fetch everything.
+        :type refresh: bool
+        :param only_list: Title of the only list that will be used. Without
+                          a fresh snapshot only its tasks are fetched.
+        :type only_list: str or None
+        '''
+
         self.wunderlist = None
-        self.get_wunderlist()
+        self.get_wunderlist(refresh, only_list)
 
-    def get_wunderlist(self):
+    def get_wunderlist(self, refresh=False, only_list=None):
         try:
             token = get_token()
         except IOError:  # first run
@@ -26,9 +35,22 @@ class WunderlistCLI(object):
 
         wunderlist = Wunderlist()
         wunderlist.set_token(token)
-        wunderlist.update_lists()
         self.wunderlist = wunderlist
 
+        if not refresh and load_snapshot(wunderlist, get_cache_ttl()):
+            return
+        if only_list is not None:
+            # a partial snapshot would hide the other lists' tasks
+            wunderlist.update_lists(lazy=True, prefetch=[only_list])
+        else:
+            self.refresh()
+
+    def refresh(self):
+        '''Fetch everything from Wunderlist and update the snapshot.'''
+
+        self.wunderlist.update_lists()
+        save_snapshot(self.wunderlist)
+
     def print_tasks(self, tasks, limit):
         '''
         :param tasks: A dict with key: TaskList, value: list of Tasks
@@ -55,21 +77,25 @@ class WunderlistCLI(object):
             self.wunderlist.add_task(task_title, list_title=list_title)
         elif list_title != "inbox":  # creating a list
             self.wunderlist.add_list(list_title)
+        save_snapshot(self.wunderlist)
 
     def complete(self, task_title, list_title):
         '''Complete a task'''
 
         self.wunderlist.complete_task(task_title, list_title=list_title)
+        save_snapshot(self.wunderlist)
 
     def delete_task(self, task_title, list_title):
         '''Delete a task'''
 
         self.wunderlist.delete_task(task_title, list_title)
+        save_snapshot(self.wunderlist)
 
     def delete_list(self, list_title):
         '''Delete a list'''
 
         self.wunderlist.delete_list(list_title)
+        save_snapshot(self.wunderlist)
 
     def overview(self, limit, show_complete):
         '''Display a few tasks from each list.
@@ -89,6 +115,21 @@ class WunderlistCLI(object):
 
         self.print_tasks(to_print, limit)
 
+    def due_before(self, due_date, show_complete):
+        '''Find tasks due before due_date in every list, grouped by list.
+
+        :returns: dict -- key: list title, value: list of Tasks
+        '''
+
+        conditions = {"due_before": due_date}
+        if not show_complete:
+            conditions["completed"] = False
+
+        tasks = {}
+        for task in self.wunderlist.find_tasks(**conditions):
+            tasks.setdefault(task.parent_list.title, []).append(task)
+        return tasks
+
     def today(self, limit, show_complete):
         '''Display tasks that are due or overdue today.
         :param limit: Maximum number of tasks to display per list.
@@ -97,17 +138,8 @@ class WunderlistCLI(object):
         :type show_complete: bool
         '''
 
-        to_print = {}
-        for task_list in self.wunderlist.lists:
-            tasks = task_list.tasks_due_before(date.today() +
-                                               timedelta(days=1))
-            if show_complete:
-                to_print[task_list.title] = tasks
-            else:
-                _tasks = [t for t in tasks if t.completed is not True]
-                to_print[task_list.title] = _tasks
-
-        self.print_tasks(to_print, limit)
+        self.print_tasks(self.due_before(date.today() + timedelta(days=1),
+                                         show_complete), limit)
 
     def week(self, limit, show_complete):
         '''Display tasks that are due or overdue this week.
@@ -117,17 +149,8 @@ class WunderlistCLI(object):
         :type show_complete: bool
         '''
 
-        to_print = {}
-        for task_list in self.wunderlist.lists:
-            tasks = task_list.tasks_due_before(date.today() +
-                                               timedelta(days=6))
-            if show_complete:
-                to_print[task_list.title] = tasks
-            else:
-                _tasks = [t for t in tasks if t.completed is not True]
-                to_print[task_list.title] = _tasks
-
-        self.print_tasks(to_print, limit)
+        self.print_tasks(self.due_before(date.today() + timedelta(days=6),
+                                         show_complete), limit)
 
     def display(self, list_title, show_complete):
         '''Display all tasks in a list.
@@ -217,9 +240,17 @@ def main():
                         "on lists. Default is inbox.")
     parser.add_argument("-t", "--task", dest="task",
                         help="Used to specify a task name.")
+    parser.add_argument("-r", "--refresh", dest="refresh",
+                        action="store_true", default=False,
+                        help="Ignore the local snapshot and fetch everything "
+                        "from Wunderlist.")
     args = parser.parse_args()
 
-    cli = WunderlistCLI()
+    # changes must be made against fresh data, not an old snapshot
+    modifying = args.add or args.complete or args.delete
+    only_list = args.list if args.display and not modifying else None
+    cli = WunderlistCLI(refresh=args.refresh or modifying,
+                        only_list=only_list)
 
     if args.add:
         cli.add(args.task, args.list)
@@ -2,10 +2,17 @@
 
 import json
 import getpass
+import hashlib
+import os
 import os.path
+import time
 
 from wunderpy import Wunderlist
 
+CONFIG_PATH = "~/.wunderpyrc"
+SNAPSHOT_PATH = "~/.wunderpy_snapshot"
+DEFAULT_CACHE_TTL = 300  # seconds
+
 try:
     input = raw_input  # python2.x
 except NameError:
@@ -46,15 +53,82 @@ def setup():
 
 
 def save_token(token):
-    '''Save a token to the config file.'''
+    '''Save a token to the config file, keeping its other settings.'''
+
+    try:
+        config = get_config()
+    except (IOError, ValueError):  # first run
+        config = {}
+    config["token"] = token
+    with open(os.path.expanduser(CONFIG_PATH), "w") as store:
+        json.dump(config, store)
+
 
-    with open(os.path.expanduser("~/.wunderpyrc"), "w") as store:
-        json.dump({"token": token}, store)
+def get_config():
+    '''Get the whole config file as a dict.'''
+
+    with open(os.path.expanduser(CONFIG_PATH), "r") as store:
+        return json.load(store)
 
 
 def get_token():
     '''Get the token from the config file'''
 
-    with open(os.path.expanduser("~/.wunderpyrc"), "r") as store:
-        token = json.load(store)
-        return token["token"]
+    return get_config()["token"]
+
+
+def get_cache_ttl():
+    '''Get the number of seconds a snapshot is considered fresh.
+
+    Set "cache_ttl" in the config file to change it, 0 disables the snapshot.
+    '''
+
+    try:
+        return get_config().get("cache_ttl", DEFAULT_CACHE_TTL)
+    except (IOError, ValueError):
+        return DEFAULT_CACHE_TTL
+
+
+def account_hash(token):
+    '''Identify the account a snapshot belongs to without storing its
+    token a second time.'''
+
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+
+def save_snapshot(wunderlist):
+    '''Write the lists and tasks of a Wunderlist to the snapshot file.'''
+
+    tasks, lists = wunderlist.dump_lists()
+    path = os.path.expanduser(SNAPSHOT_PATH)
+    tmp_path = "{}.{}".format(path, os.getpid())
+    with open(tmp_path, "w") as store:
+        json.dump({"saved_at": time.time(),
+                   "account": account_hash(wunderlist.token),
+                   "tasks": tasks, "lists": lists},
+                  store, separators=(",", ":"))
+    os.rename(tmp_path, path)  # atomic, readers never see half a snapshot
+
+
+def load_snapshot(wunderlist, ttl):
+    '''Populate a Wunderlist from the snapshot file, if it is fresh enough
+    and was saved for the same account (its token must be set).
+
+    :param ttl: Maximum age of the snapshot in seconds.
+    :type ttl: int
+    :returns: bool -- True if the snapshot was loaded.
+    '''
+
+    try:
+        with open(os.path.expanduser(SNAPSHOT_PATH), "r") as store:
+            snapshot = json.load(store)
+    except (IOError, ValueError):
+        return False
+
+    if time.time() - snapshot["saved_at"] > ttl:
+        return False
+    if snapshot.get("account") != account_hash(wunderlist.token):
+        return False
+
+    wunderlist.load_lists(snapshot["tasks"], snapshot["lists"])
+    return True
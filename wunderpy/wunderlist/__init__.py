@@ -1,3 +1,4 @@
 '''Classes implementing a basic Wunderlist client.'''
 
 from .wunderlist import Wunderlist
+from .refresher import Refresher
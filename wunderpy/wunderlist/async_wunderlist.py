@@ -0,0 +1,234 @@
+'''An asyncio version of the Wunderlist client.
+
+Like wunderpy.api.async_client this needs python 3 and aiohttp:
+
+    from wunderpy.wunderlist.async_wunderlist import AsyncWunderlist
+    from wunderpy.wunderlist.async_wunderlist import AsyncRefresher
+'''
+
+import asyncio
+
+from wunderpy import api
+from wunderpy.api.async_client import AsyncAPIClient
+from .wunderlist import Wunderlist
+from .refresher import Refresher
+from .task_list import TaskList
+from .task import Task
+
+
+class AsyncWunderlist(AsyncAPIClient, Wunderlist):
+    '''A Wunderlist client where every method that talks to the server
+    is a coroutine.
+
+    Lookups and filters (list_with_title, get_task, tasks_due_before,
+    find_tasks...) are the same as Wunderlist's and don't need awaiting.
+    '''
+
+    def __init__(self, lists=None, session=None, **connector_options):
+        '''
+        :param lists: TaskLists to start with.
+        :type lists: list or None
+        :param session: See AsyncAPIClient.
+        :param connector_options: See AsyncAPIClient.
+        '''
+
+        AsyncAPIClient.__init__(self, session, **connector_options)
+        # one event loop thread, so no need for thread_safe mode
+        self._init_lists(lists, False)
+        self.queue = None  # write-behind mode isn't supported here
+
+    @staticmethod
+    def _unsupported(name):
+        raise TypeError("AsyncWunderlist doesn't support {}".format(name))
+
+    def prefetch(self, *args, **kwargs):
+        '''Not supported, lists are always loaded with their tasks.'''
+
+        self._unsupported("prefetch")
+
+    def enable_write_behind(self, *args, **kwargs):
+        '''Not supported, use send_requests to batch changes instead.'''
+
+        self._unsupported("write-behind mode")
+
+    disable_write_behind = flush = enable_write_behind
+
+    async def _fetch_all(self):
+        '''Get every task and list, see Wunderlist._fetch_all.'''
+
+        if self.response_cache is not None:
+            return await asyncio.gather(
+                self.send_request(api.calls.get_all_tasks()),
+                self.send_request(api.calls.get_lists()))
+        requests = [api.calls.get_all_tasks(), api.calls.get_lists()]
+        return [result async for result in self.send_requests(requests)]
+
+    async def update_lists(self):
+        '''Populate the lists with all tasks, see Wunderlist.update_lists.'''
+
+        tasks, lists = await self._fetch_all()
+        self.load_lists(tasks, lists)
+        self._fetched = (tasks, lists)
+
+    async def sync(self):
+        '''Bring the lists up to date in place, see Wunderlist.sync.
+
+        :returns: tuple -- (changed TaskLists, changed Tasks)
+        '''
+
+        if not self.lists:
+            await self.update_lists()
+            return (list(self.lists),
+                    [task for l in self.lists for task in l.tasks])
+
+        tasks, lists = await self._fetch_all()
+        if self._unchanged(tasks, lists):
+            return [], []
+        changes = self.merge_lists(tasks, lists)
+        self._fetched = (tasks, lists)
+        return changes
+
+    async def iter_tasks(self, per_page=None, timeout=30):
+        '''Yield every task without keeping them, see Wunderlist.iter_tasks.
+
+        An async generator.
+        '''
+
+        parents = dict((l.id, l) for l in self.lists)
+        first_ids = set()  # to notice a server repeating its pages
+        page = 1
+        while True:
+            count = 0
+            request = api.calls.get_all_tasks(page, per_page)
+            async for info in self.stream_request(request, timeout):
+                if count == 0:
+                    if info.get("id") in first_ids:
+                        return
+                    first_ids.add(info.get("id"))
+                count += 1
+                yield Task(info, parent_list=parents.get(info.get("list_id")))
+            # a page longer than asked for means paging was ignored
+            if per_page is None or count != per_page:
+                return
+            page += 1
+
+    async def add_task(self, title, list_title="inbox", note=None,
+                       due_date=None, starred=False):
+        '''Create a new task, see Wunderlist.add_task.'''
+
+        parent_list = self.list_with_title(list_title)
+        add_task = api.calls.add_task(title, parent_list.id,
+                                      due_date=due_date, starred=starred)
+        result = await self.send_request(add_task)
+
+        # update internal state
+        new_task = Task(result, parent_list=parent_list)
+        parent_list.add_task(new_task)
+        self._task_ids[new_task.id] = new_task
+
+        if note:
+            await self.send_request(api.calls.set_note_for_task(note,
+                                                                result["id"]))
+
+    async def complete_task(self, task_title, list_title="inbox"):
+        '''Complete a task with the given title in the given list.'''
+
+        task = self.get_task(task_title, list_title)
+        task.info = await self.send_request(api.calls.complete_task(task.id))
+
+    async def update_task_due_date(self, task_title, due_date,
+                                   recurrence_count=1, list_title="inbox"):
+        '''Set a task's due date, see Wunderlist.update_task_due_date.'''
+
+        task = self.get_task(task_title, list_title)
+        task.info = await self.send_request(
+            api.calls.set_task_due_date(task.id, due_date, recurrence_count))
+
+    async def update_task_title(self, task_title, new_title,
+                                list_title="inbox"):
+        '''Rename a task, see Wunderlist.update_task_title.'''
+
+        task = self.get_task(task_title, list_title)
+        task.info = await self.send_request(
+            api.calls.set_title_for_task(task.id, new_title))
+
+    async def delete_task(self, task_title, list_title="inbox"):
+        '''Delete a task'''
+
+        _list = self.list_with_title(list_title)
+        task = _list.task_with_title(task_title)
+        await self.send_request(api.calls.delete_task(task.id))
+        _list.remove_task(task)
+        self._task_ids.pop(task.id, None)
+
+    async def add_list(self, list_title):
+        '''Create a new list'''
+
+        new = await self.send_request(api.calls.add_list(list_title))
+        self._append_list(TaskList(info=new))
+
+    async def delete_list(self, list_title):
+        '''Delete a list.'''
+
+        _list = self.list_with_title(list_title)
+        await self.send_request(api.calls.delete_list(_list.id))
+        self._remove_list(_list)
+
+
+class AsyncRefresher(Refresher):
+    '''A Refresher for an AsyncWunderlist, running as an asyncio task.'''
+
+    def __init__(self, wunderlist, *args, **kwargs):
+        '''Takes the same arguments as Refresher.'''
+
+        Refresher.__init__(self, wunderlist, *args, **kwargs)
+        self.task = None
+        self.wake = None  # an asyncio.Event, made in start
+
+    async def refresh(self):
+        '''Sync once now, returning whether anything changed.'''
+
+        try:
+            changes = await self.wunderlist.sync()
+        except Exception as e:
+            self._failed(e)
+            changed = False
+        else:
+            changed = self._synced(changes)
+        self._next_interval(changed)
+        return changed
+
+    def start(self):
+        '''Start syncing in a task on the running event loop.'''
+
+        if self.task is None or self.task.done():
+            self.wake = asyncio.Event()
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            try:
+                await asyncio.wait_for(self.wake.wait(),
+                                       self.current_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+    def refresh_soon(self):
+        '''Cut the current wait short.'''
+
+        self.current_interval = self.interval
+        if self.wake is not None:
+            self.wake.set()
+
+    async def stop(self):
+        '''Stop syncing, cancelling a sync in progress.'''
+
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
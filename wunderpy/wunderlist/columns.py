@@ -0,0 +1,55 @@
+'''Implements the TaskColumns class.'''
+
+
+from array import array
+
+
+# bits in TaskColumns.flags
+COMPLETED = 1
+STARRED = 2
+
+NO_DUE_DATE = 0  # date ordinals start at 1
+
+
+class TaskColumns(object):
+    '''Flat per-field arrays describing a list of Tasks.
+
+    Position i of every column describes tasks[i], so filters can scan
+    compact arrays instead of every Task's info dict, see query.py.
+    '''
+
+    __slots__ = ("tasks", "ids", "due", "flags")
+
+    def __init__(self, tasks):
+        '''
+        :param tasks: The Tasks to describe, must not change afterwards.
+        :type tasks: list
+        '''
+
+        self.tasks = tasks
+        self.ids = [task.id for task in tasks]
+        self.due = array("l")
+        self.flags = array("B")
+        for task in tasks:
+            due = task.due_date
+            self.due.append(due.toordinal() if due else NO_DUE_DATE)
+            self.flags.append((COMPLETED if task.completed else 0) |
+                              (STARRED if task.starred else 0))
+
+    @classmethod
+    def join(cls, all_columns):
+        '''Concatenate several TaskColumns into one.'''
+
+        joined = cls([])
+        for columns in all_columns:
+            joined.tasks.extend(columns.tasks)
+            joined.ids.extend(columns.ids)
+            joined.due.extend(columns.due)
+            joined.flags.extend(columns.flags)
+        return joined
+
+    def select(self, positions):
+        '''Return the Tasks at the given positions.'''
+
+        tasks = self.tasks
+        return [tasks[i] for i in positions]
@@ -0,0 +1,167 @@
+'''Implements the Index and DueIndex classes.'''
+
+
+from bisect import bisect_left, bisect_right
+
+
+_OWN_KEY = object()  # sentinel, None is a perfectly good key
+
+
+class _Bucket(list):
+    '''The objects sharing one key. Objects with a key of their own are
+    stored as they are, most keys (like ids) are unique.'''
+
+    __slots__ = ()
+
+
+class Index(object):
+    '''Hash index of objects on one of their attributes.
+
+    Every key maps to the objects that have it, in the order they were added.
+    Objects are matched on identity, never on equality.
+    '''
+
+    def __init__(self, attribute, items=()):
+        '''
+        :param attribute: Name of the attribute to index on.
+        :type attribute: str
+        :param items: Objects to start with.
+        :type items: iterable
+        '''
+
+        self.attribute = attribute
+        self.buckets = {}  # key: object, or _Bucket if several have it
+        self.size = 0
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        '''Add an object under its current key.'''
+
+        key = getattr(item, self.attribute)
+        existing = self.buckets.get(key, _OWN_KEY)
+        if existing is _OWN_KEY:
+            self.buckets[key] = item
+        elif type(existing) is _Bucket:
+            existing.append(item)
+        else:
+            self.buckets[key] = _Bucket((existing, item))
+        self.size += 1
+
+    def remove(self, item, key=_OWN_KEY):
+        '''Remove an object.
+
+        :param key: The key the object was added under, if it has changed.
+        :returns: bool -- False if the object was not in the index.
+        '''
+
+        if key is _OWN_KEY:
+            key = getattr(item, self.attribute)
+        existing = self.buckets.get(key, _OWN_KEY)
+        if existing is item:
+            del self.buckets[key]
+            self.size -= 1
+            return True
+        if type(existing) is not _Bucket:
+            return False
+        for position, other in enumerate(existing):
+            if other is item:
+                del existing[position]
+                if len(existing) == 1:
+                    self.buckets[key] = existing[0]
+                self.size -= 1
+                return True
+        return False
+
+    def move(self, item, old_key):
+        '''Re-file an object whose key changed from old_key.'''
+
+        if self.remove(item, old_key):
+            self.add(item)
+
+    def get(self, key):
+        '''Return all objects with the given key.'''
+
+        existing = self.buckets.get(key, _OWN_KEY)
+        if existing is _OWN_KEY:
+            return []
+        if type(existing) is _Bucket:
+            return list(existing)
+        return [existing]
+
+    def first(self, key):
+        '''Return the first object added with the given key, or None.'''
+
+        existing = self.buckets.get(key)
+        if type(existing) is _Bucket:
+            return existing[0]
+        return existing
+
+
+class DueIndex(object):
+    '''Tasks sorted on their due date, for range queries with bisect.
+
+    Tasks without a due date are left out. Tasks due on the same day stay
+    in the order they were added.
+    '''
+
+    def __init__(self, tasks=()):
+        '''
+        :param tasks: Tasks to start with.
+        :type tasks: iterable
+        '''
+
+        pairs = [(task.due_date.toordinal(), task) for task in tasks
+                 if task.due_date is not None]
+        pairs.sort(key=lambda pair: pair[0])  # stable, keeps list order
+        self.ordinals = [ordinal for ordinal, task in pairs]
+        self.tasks = [task for ordinal, task in pairs]
+        # id(task): ordinal it was filed under, the task may have changed since
+        self.keys = dict((id(task), ordinal) for ordinal, task in pairs)
+
+    def add(self, task):
+        '''File a Task under its current due date.'''
+
+        due = task.due_date
+        if due is None:
+            return
+        ordinal = due.toordinal()
+        position = bisect_right(self.ordinals, ordinal)
+        self.ordinals.insert(position, ordinal)
+        self.tasks.insert(position, task)
+        self.keys[id(task)] = ordinal
+
+    def remove(self, task):
+        '''Remove a Task.
+
+        :returns: bool -- False if the task was not in the index.
+        '''
+
+        ordinal = self.keys.pop(id(task), None)
+        if ordinal is None:
+            return False
+        start = bisect_left(self.ordinals, ordinal)
+        end = bisect_right(self.ordinals, ordinal)
+        for position in range(start, end):
+            if self.tasks[position] is task:
+                del self.ordinals[position]
+                del self.tasks[position]
+                return True
+        return False
+
+    def between(self, start, end):
+        '''Return the Tasks due on or after start and before end.
+
+        :param start: First date to include, or None for no lower bound.
+        :type start: date
+        :param end: First date to exclude, or None for no upper bound.
+        :type end: date
+        '''
+
+        low = 0
+        high = len(self.ordinals)
+        if start is not None:
+            low = bisect_left(self.ordinals, start.toordinal())
+        if end is not None:
+            high = bisect_left(self.ordinals, end.toordinal())
+        return self.tasks[low:high]
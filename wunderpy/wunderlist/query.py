@@ -0,0 +1,90 @@
+'''Batched filtering of TaskColumns.
+
+NumPy is used when it is installed, otherwise a single pure python pass
+over the arrays does the same job.
+'''
+
+from datetime import timedelta
+
+from .columns import COMPLETED, STARRED, NO_DUE_DATE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def find_positions(columns, due_from=None, due_before=None, completed=None,
+                   starred=None):
+    '''Return the positions of the Tasks matching every given condition.
+
+    Conditions left as None are ignored.
+
+    :param columns: The columns to search.
+    :type columns: TaskColumns
+    :param due_from: Only Tasks due on or after this date.
+    :type due_from: date
+    :param due_before: Only Tasks due before this date.
+    :type due_before: date
+    :param completed: Only Tasks with this completion status.
+    :type completed: bool
+    :param starred: Only Tasks with this starred status.
+    :type starred: bool
+    :returns: list
+    '''
+
+    has_due = due_from is not None or due_before is not None
+    low = due_from.toordinal() if due_from is not None else NO_DUE_DATE + 1
+    high = due_before.toordinal() if due_before is not None else None
+
+    mask = value = 0
+    if completed is not None:
+        mask |= COMPLETED
+        value |= COMPLETED if completed else 0
+    if starred is not None:
+        mask |= STARRED
+        value |= STARRED if starred else 0
+
+    if numpy is not None:
+        return _find_numpy(columns, has_due, low, high, mask, value)
+
+    positions = []
+    for position, (due, flags) in enumerate(zip(columns.due, columns.flags)):
+        if has_due and (due < low or (high is not None and due >= high)):
+            continue
+        if flags & mask != value:
+            continue
+        positions.append(position)
+    return positions
+
+
+def _find_numpy(columns, has_due, low, high, mask, value):
+    '''find_positions, done with NumPy.'''
+
+    if not columns.ids:
+        return []
+
+    selected = numpy.ones(len(columns.ids), dtype=bool)
+    if has_due:
+        due = numpy.frombuffer(columns.due, dtype=columns.due.typecode)
+        selected &= due >= low
+        if high is not None:
+            selected &= due < high
+    if mask:
+        flags = numpy.frombuffer(columns.flags, dtype=columns.flags.typecode)
+        selected &= (flags & mask) == value
+
+    return numpy.flatnonzero(selected).tolist()
+
+
+def find_tasks(columns, due_on=None, **conditions):
+    '''Like find_positions, but return the Tasks themselves.
+
+    :param due_on: Only Tasks due on this date.
+    :type due_on: date
+    '''
+
+    if due_on is not None:
+        conditions["due_from"] = due_on
+        conditions["due_before"] = due_on + timedelta(days=1)
+    return columns.select(find_positions(columns, **conditions))
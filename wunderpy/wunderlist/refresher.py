@@ -0,0 +1,120 @@
+'''Implements the Refresher class.'''
+
+
+import threading
+
+
+class Refresher(object):
+    '''Keeps a Wunderlist current by calling sync from a background thread.
+
+    It syncs every interval seconds. Each sync that changes nothing (or
+    fails) makes the wait backoff times longer, up to max_interval; the
+    first one that changes something brings it back to interval. Give
+    the Wunderlist a ResponseCache and quiet syncs cost two 304s.
+
+    Readers on other threads should use a Wunderlist in thread_safe mode.
+    For an AsyncWunderlist use AsyncRefresher instead.
+    '''
+
+    def __init__(self, wunderlist, interval=60.0, max_interval=900.0,
+                 backoff=2.0, on_change=None, on_error=None):
+        '''
+        :param wunderlist: The Wunderlist to keep current.
+        :type wunderlist: Wunderlist
+        :param interval: Seconds between syncs while things change.
+        :type interval: float
+        :param max_interval: Longest wait between two syncs.
+        :type max_interval: float
+        :param backoff: What the wait is multiplied by after a quiet sync.
+        :type backoff: float
+        :param on_change: Called with (changed TaskLists, changed Tasks)
+                          after a sync that changed something.
+        :type on_change: callable or None
+        :param on_error: Called with the exception when a sync or
+                         on_change fails. The Refresher keeps going
+                         either way.
+        :type on_error: callable or None
+        '''
+
+        self.wunderlist = wunderlist
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.on_change = on_change
+        self.on_error = on_error
+        self.current_interval = interval
+        self.thread = None
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+
+    def _next_interval(self, changed):
+        '''Adapt current_interval to whether the last sync changed anything.'''
+
+        if changed:
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(self.max_interval,
+                                        self.current_interval * self.backoff)
+        return self.current_interval
+
+    def _synced(self, changes):
+        '''Handle the result of a sync, returning whether anything changed.'''
+
+        changed_lists, changed_tasks = changes
+        if not changed_lists and not changed_tasks:
+            return False
+        if self.on_change is not None:
+            try:
+                self.on_change(changed_lists, changed_tasks)
+            except Exception as e:  # mustn't stop the refresher
+                self._failed(e)
+        return True
+
+    def _failed(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def refresh(self):
+        '''Sync once now, returning whether anything changed.'''
+
+        try:
+            changes = self.wunderlist.sync()
+        except Exception as e:
+            self._failed(e)
+            changed = False
+        else:
+            changed = self._synced(changes)
+        self._next_interval(changed)
+        return changed
+
+    def start(self):
+        '''Start syncing in a daemon thread, the first sync is right away.'''
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run,
+                                       name="wunderpy-refresher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.refresh()
+            self.wake.wait(self.current_interval)
+            self.wake.clear()
+
+    def refresh_soon(self):
+        '''Cut the current wait short, e.g. after a push notification.'''
+
+        self.current_interval = self.interval
+        self.wake.set()
+
+    def stop(self, timeout=None):
+        '''Stop syncing and wait for a sync in progress to finish.'''
+
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
@@ -1,13 +1,57 @@
 '''Implements the Task class.'''
 
 
+import datetime
+import re
+
 import dateutil.parser
+import dateutil.tz
+
+
+ISO_FORMAT = re.compile(r"(\d{4})-(\d\d)-(\d\d)"
+                        r"(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?"
+                        r"(Z|[+-]\d\d:?\d\d)?)?$")
+
+
+def parse_datetime(value):
+    '''Parse a date or datetime string into a datetime.
+
+    The ISO 8601 formats Wunderlist sends are handled directly, anything
+    else goes through dateutil, which is much slower.
+    '''
+
+    match = ISO_FORMAT.match(value)
+    if not match:
+        return dateutil.parser.parse(value)
 
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    microsecond = int(fraction.ljust(6, "0")) if fraction else 0
+    if zone is None:
+        tzinfo = None
+    elif zone == "Z":
+        tzinfo = dateutil.tz.tzutc()
+    else:
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:]) * 60
+        if zone[0] == "-":
+            offset = -offset
+        tzinfo = dateutil.tz.tzoffset(None, offset)
 
-class Task(dict):
+    return datetime.datetime(int(year), int(month), int(day),
+                             int(hour or 0), int(minute or 0),
+                             int(second or 0), microsecond, tzinfo)
+
+
+#: Stands for a date that hasn't been parsed yet, None means there is none.
+_UNPARSED = object()
+
+
+class Task(object):
     '''Object representing a single task in Wunderlist.'''
 
-    def __init__(self, info, parent_list=None, subtasks=None, *args):
+    # accounts can hold a lot of these, so keep them small
+    __slots__ = ("parent_list", "_info", "_due", "_created", "_subtasks")
+
+    def __init__(self, info, parent_list=None, subtasks=None):
         '''
         :param info: The task information obtained from the API.
         :type info: dict
@@ -18,22 +62,58 @@ class Task(dict):
         '''
 
         self.parent_list = parent_list
-        self.info = info
-        if subtasks:
-            self.subtasks = subtasks
-        else:
-            self.subtasks = []
-        dict.__init__(self, args)
+        self._info = info
+        self._due = self._created = _UNPARSED  # see due_date, created_at
+        self._subtasks = subtasks or None
 
     def __getitem__(self, key):
-        return dict.__getitem__(self.info, key)
+        return self._info[key]
 
     def __setitem__(self, key, value):
-        dict.__setitem__(self.info, key, value)
+        old_title, old_id = self.title, self.id
+        self._info[key] = value
+        self._info_changed(old_title, old_id)
+
+    @property
+    def subtasks(self):
+        '''A list of Task objects belonging to this Task.'''
+
+        if self._subtasks is None:
+            self._subtasks = []
+        return self._subtasks
+
+    @subtasks.setter
+    def subtasks(self, subtasks):
+        self._subtasks = subtasks
+
+    @property
+    def info(self):
+        '''The task information obtained from the API.'''
+
+        return self._info
+
+    @info.setter
+    def info(self, info):
+        old_title, old_id = self.title, self.id
+        self._info = info
+        self._info_changed(old_title, old_id)
+
+    def _info_changed(self, old_title, old_id):
+        '''Drop cached values and let the parent list update its indexes.'''
+
+        self._due = self._created = _UNPARSED
+        if self.parent_list is not None:
+            self.parent_list.task_changed(self, old_title, old_id)
 
     def __repr__(self):
         return "<wunderpy.wunderlist.Task: {} {}>".format(self.title, self.id)
 
+    def _parse(self, key):
+        '''Parse the datetime in info[key], None if there isn't one.'''
+
+        value = self._info.get(key)
+        return parse_datetime(value) if value else None
+
     @property
     def title(self):
         '''The Task's title.'''
@@ -50,21 +130,18 @@ class Task(dict):
     def created_at(self):
         '''Return a Datetime object for the moment the Task was created.'''
 
-        created = self.info.get("created_at")
-        if created:
-            return dateutil.parser.parse(created)
-        else:
-            return None
+        if self._created is _UNPARSED:
+            self._created = self._parse("created_at")
+        return self._created
 
     @property
     def due_date(self):
         '''Return a Date object with the date the Task is due, if any.'''
 
-        due = self.info.get("due_date")
-        if due:
-            return dateutil.parser.parse(due).date()
-        else:
-            return None
+        if self._due is _UNPARSED:
+            due = self._parse("due_date")
+            self._due = due.date() if due else None
+        return self._due
 
     @property
     def due_date_iso(self):
@@ -1,6 +1,15 @@
 '''Implements the TaskList class.'''
 
 
+import threading
+from datetime import timedelta
+
+from .task import Task
+from .index import Index, DueIndex
+from .columns import TaskColumns
+from . import query
+
+
 class TaskList(dict):
     '''Object representing a single task list in Wunderlist.'''
 
@@ -12,6 +21,9 @@ class TaskList(dict):
         :type info: dict
         '''
 
+        self._version = 0  # counts changes
+        self._frozen = None  # (version, info, TaskList), see freeze
+        self._loader = None  # see lazy_load
         if tasks:
             self.tasks = tasks
         else:
@@ -19,11 +31,95 @@ class TaskList(dict):
         self.info = info
         dict.__init__(self, args)
 
+    @property
+    def tasks(self):
+        '''The Tasks in this list.
+
+        Use add_task and remove_task to change it, so the indexes stay
+        current. Assigning a new list is fine too.
+        '''
+
+        self._load()
+        return self._tasks
+
+    @tasks.setter
+    def tasks(self, tasks):
+        self._loader = None
+        self._tasks = tasks
+        self._indexes = None
+        self._columns = None
+        self._version += 1
+
+    def lazy_load(self, loader):
+        '''Fetch the tasks only once they are first needed.
+
+        :param loader: Called with this TaskList, returns its task dicts.
+        :type loader: callable
+        '''
+
+        self._tasks = []
+        self._indexes = None
+        self._columns = None
+        self._loader = loader
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        '''Whether the tasks are there, or still to be fetched.'''
+
+        return self._loader is None
+
+    def _load(self):
+        if self._loader is None:
+            return
+        with self._load_lock:
+            loader = self._loader
+            if loader is not None:  # not loaded while we waited
+                self.tasks = [Task(info, parent_list=self)
+                              for info in loader(self)]
+
+    def _get_indexes(self):
+        '''Return the title, id and due date indexes, building them if needed.'''
+
+        self._load()
+        # the size check catches tasks appended to self.tasks directly
+        if self._indexes is None or self._indexes[0].size != len(self._tasks):
+            self._indexes = (Index("title", self._tasks),
+                             Index("id", self._tasks),
+                             DueIndex(self._tasks))
+        return self._indexes
+
+    def _get_columns(self):
+        '''Return the TaskColumns for the tasks, building them if needed.
+
+        They are only built once a filter needs them and are thrown away
+        whenever a task changes.
+        '''
+
+        self._load()
+        if self._columns is None or len(self._columns.ids) != len(self._tasks):
+            self._columns = TaskColumns(self._tasks)
+        return self._columns
+
+    def task_changed(self, task, old_title, old_id):
+        '''Called by a Task in this list when its info changes.'''
+
+        self._columns = None
+        self._version += 1
+        if self._indexes is not None:
+            titles, ids, due = self._indexes
+            if ids.remove(task, old_id):  # ignore tasks not in this list
+                ids.add(task)
+                titles.move(task, old_title)
+                due.remove(task)
+                due.add(task)
+
     def __getitem__(self, key):
         return dict.__getitem__(self.info, key)
 
     def __setitem__(self, key, value):
         dict.__setitem__(self.info, key, value)
+        self._version += 1
 
     def __repr__(self):
         return "<wunderpy.wunderlist.TaskList: {} {}>".format(self.title,
@@ -42,12 +138,57 @@ class TaskList(dict):
 
     def add_task(self, task):
         '''Add a Task to the list.'''
-        self.tasks.append(task)
+
+        indexes = self._get_indexes()
+        if task.parent_list is None:
+            task.parent_list = self
+        self._tasks.append(task)
+        self._columns = None
+        self._version += 1
+        for index in indexes:
+            index.add(task)
 
     def remove_task(self, task):
         '''Remove a Task from the TaskList.'''
 
-        self.tasks.remove(task)
+        indexes = self._get_indexes()
+        # Tasks compare equal as dicts, so match on identity
+        for position, existing in enumerate(self._tasks):
+            if existing is task:
+                del self._tasks[position]
+                self._columns = None
+                self._version += 1
+                for index in indexes:
+                    index.remove(task)
+                return
+        raise ValueError("{} is not in {}".format(task, self))
+
+    def freeze(self):
+        '''Return a copy of the list and its tasks for other threads to read.
+
+        The copy has its indexes built already, so reading it never
+        changes it. It is reused until this list or one of its tasks
+        changes. See Wunderlist's thread_safe mode.
+
+        :returns: TaskList
+        '''
+
+        frozen = self._frozen
+        if (frozen is not None and frozen[0] == self._version and
+                frozen[1] is self.info):
+            return frozen[2]
+
+        copy = TaskList(dict(self.info))
+        if self._loader is not None:  # the copy loads its tasks itself
+            copy.lazy_load(self._loader)
+            self._frozen = (self._version, self.info, copy)
+            return copy
+        copy.tasks = [Task(dict(task.info), parent_list=copy)
+                      for task in self._tasks]
+        copy._get_indexes()
+        copy._get_columns()
+        self._frozen = (self._version, self.info, copy)
+        return copy
 
     def task_with_title(self, title):
         '''Return the most recently created Task with the given title.'''
@@ -65,21 +206,45 @@ class TaskList(dict):
         :param title: Title to match Tasks with.
         :type title: str
         '''
-        return [task for task in self.tasks if task.title == title]
+        titles, ids, due = self._get_indexes()
+        return titles.get(title)
+
+    def task_with_id(self, task_id):
+        '''Return the Task with the given ID, or None.'''
+
+        titles, ids, due = self._get_indexes()
+        return ids.first(task_id)
+
+    def find_tasks(self, **conditions):
+        '''Find all Tasks matching every given condition.
+
+        Takes due_on, due_from, due_before, completed and starred,
+        see query.find_positions.
+        '''
+
+        return query.find_tasks(self._get_columns(), **conditions)
+
+    def tasks_due_between(self, start, end):
+        '''Find all Tasks due from start to end, both included.
+
+        Tasks are returned sorted by due date.
+        '''
+
+        titles, ids, due = self._get_indexes()
+        return due.between(start, end + timedelta(days=1))
 
     def tasks_due_before(self, date):
         '''Find all Tasks that are due before date.'''
 
-        return [task for task in self.tasks
-                if task.due_date and task.due_date < date]
+        titles, ids, due = self._get_indexes()
+        return due.between(None, date)
 
     def tasks_due_on(self, date):
         '''Find all Tasks that are due on date.'''
 
-        return [task for task in self.tasks
-                if task.due_date and task.due_date == date]
+        return self.tasks_due_between(date, date)
 
     def incomplete_tasks(self):
         '''Return all incomplete tasks.'''
 
-        return [task for task in self.tasks if task.completed is not True]
+        return self.find_tasks(completed=False)
@@ -0,0 +1,55 @@
+'''Implements the MutationQueue class.'''
+
+
+import time
+
+
+class MutationQueue(object):
+    '''Requests waiting to be sent to Wunderlist in one batch.'''
+
+    def __init__(self, max_size=100, max_delay=5.0):
+        '''
+        :param max_size: Flush once this many requests are queued.
+        :type max_size: int
+        :param max_delay: Flush once the oldest request has waited this
+                          many seconds.
+        :type max_delay: float
+        '''
+
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.pending = []  # (Operation, callback, rollback)
+        self.first_queued = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def append(self, request, callback=None, rollback=None):
+        '''Queue a request.
+
+        :param callback: Called with the server's response once sent.
+        :type callback: callable or None
+        :param rollback: Called instead if the request fails, to undo
+                         the change it made before being sent.
+        :type rollback: callable or None
+        '''
+
+        if not self.pending:
+            self.first_queued = time.time()
+        self.pending.append((request, callback, rollback))
+
+    def is_due(self):
+        '''Check whether it's time to flush.'''
+
+        if not self.pending:
+            return False
+        return (len(self.pending) >= self.max_size or
+                time.time() - self.first_queued >= self.max_delay)
+
+    def take(self):
+        '''Empty the queue, returning what was in it.'''
+
+        pending = self.pending
+        self.pending = []
+        self.first_queued = None
+        return pending
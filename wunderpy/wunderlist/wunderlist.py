@@ -2,71 +2,462 @@
 .. module:: wunderlist
 '''
 
+import functools
 import itertools
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 
 from wunderpy import api
 from .task_list import TaskList
 from .task import Task
+from .index import Index
+from .write_behind import MutationQueue
+from .columns import TaskColumns
+from . import query
+
+
+ORPHANS_INFO = {"title": "orphans", "id": None, "created_on": None,
+                "updated_on": None}
+
+
+def group_tasks(tasks, list_ids):
+    '''Bucket task dicts by their list_id in a single pass.
+
+    :param tasks: Task information dicts returned by the API.
+    :type tasks: list
+    :param list_ids: IDs of every known list.
+    :type list_ids: list
+    :returns: tuple -- (dict of list_id: [task dicts], [orphaned task dicts])
+    '''
+
+    buckets = dict((list_id, []) for list_id in list_ids)
+    orphans = []
+    for task in tasks:
+        bucket = buckets.get(task.get("list_id"))
+        if bucket is None:
+            orphans.append(task)
+        else:
+            bucket.append(task)
+    return buckets, orphans
+
+
+#: What readers see in thread_safe mode: frozen TaskLists and their indexes.
+Snapshot = namedtuple("Snapshot", ["lists", "indexes", "orphans"])
+
+
+def writes(method):
+    '''Make a Wunderlist method run as the writer, see Wunderlist.'''
+
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return write
+
+
+def is_changed(old, new):
+    '''Check whether an API object differs from our stored copy.
+
+    The updated_at revision is compared when both sides have one,
+    otherwise the whole dicts are.
+    '''
+
+    if "updated_at" in old and "updated_at" in new:
+        return old["updated_at"] != new["updated_at"]
+    return old != new
 
 
 class Wunderlist(api.APIClient):
-    '''A basic Wunderlist client.'''
+    '''A basic Wunderlist client.
+
+    Changes (update_lists, sync, add_task, delete_list...) are made by one
+    thread at a time. In thread_safe mode other threads can read at the
+    same time without blocking: they see a frozen copy of the lists,
+    published whenever a change is finished. Only the lists and tasks
+    that changed are copied. The thread making a change sees its work in
+    progress, and update_lists and sync only hold the lock once the
+    server has answered.
+    '''
+
+    def __init__(self, lists=None, session=None, thread_safe=False,
+                 **pool_options):
+        '''
+        :param lists: TaskLists to start with.
+        :type lists: list or None
+        :param session: See APIClient.
+        :param thread_safe: Let other threads read while one changes the
+                            lists.
+        :type thread_safe: bool
+        :param pool_options: See APIClient.
+        '''
+
+        api.APIClient.__init__(self, session, **pool_options)
+        self._init_lists(lists, thread_safe)
+        # a MutationQueue in write-behind mode, see enable_write_behind
+        self.queue = None
+        self.on_flush_error = None
+        self._flush_timer = None  # sends what nothing else flushed
 
-    def __init__(self, lists=None):
-        api.APIClient.__init__(self)
+    def _init_lists(self, lists, thread_safe):
+        self.thread_safe = thread_safe
+        self._write_lock = threading.RLock()
+        self._writer = None  # the Thread making a change
+        self._snapshot = None  # published in thread_safe mode
+        self._fetched = None  # the (tasks, lists) last loaded or merged
 
         if lists:
             self.lists = lists
         else:
             self.lists = []
+        # tasks whose list_id matched no known list during update_lists
+        self.orphans = TaskList(dict(ORPHANS_INFO))
+        if thread_safe:
+            self._publish()
+
+    def _reading(self):
+        '''Whether this thread should see the published Snapshot.'''
+
+        return (self._snapshot is not None and
+                self._writer is not threading.current_thread())
+
+    @property
+    def lists(self):
+        '''All of the TaskLists.
+
+        Use add_list and delete_list to change it, so the indexes stay
+        current. Assigning a new list is fine too.
+        '''
+
+        if self._reading():
+            return self._snapshot.lists
+        return self._lists
+
+    @lists.setter
+    def lists(self, lists):
+        self._lists = lists
+        self._indexes = None
+        self._task_ids = {}  # task id: Task, see task_with_id
+
+    @property
+    def orphans(self):
+        '''A TaskList of the tasks whose list wasn't found.'''
+
+        if self._reading():
+            return self._snapshot.orphans
+        return self._orphans
+
+    @orphans.setter
+    def orphans(self, orphans):
+        self._orphans = orphans
+
+    @contextmanager
+    def _writing(self):
+        '''Hold the writer lock, publishing the changes at the end.'''
+
+        with self._write_lock:
+            outer = self._writer is None
+            self._writer = threading.current_thread()
+            try:
+                yield
+            finally:
+                if outer:
+                    self._writer = None
+                    if self.thread_safe:
+                        self._publish()
+
+    def _publish(self):
+        '''Make the current lists what readers see.'''
+
+        lists = [task_list.freeze() for task_list in self._lists]
+        indexes = (Index("title", lists), Index("id", lists))
+        self._snapshot = Snapshot(lists, indexes, self._orphans.freeze())
+
+    def _get_indexes(self):
+        '''Return the (title, id) Indexes of lists, building them if needed.'''
+
+        if self._reading():
+            return self._snapshot.indexes
+
+        # the size check catches lists appended to self.lists directly
+        if self._indexes is None or self._indexes[0].size != len(self._lists):
+            self._indexes = (Index("title", self._lists),
+                             Index("id", self._lists))
+        return self._indexes
 
     def __repr__(self):
         "<wunderpy.Wunderlist: {}>".format(self.token)
 
     # login(self, email, password) is inherited from api.APIClient
 
-    def update_lists(self):
+    def update_lists(self, lazy=False, prefetch=None):
         '''Populate the lists with all tasks.
 
         This must be run right after logging in,
-        before doing any operations.
+        before doing any operations. To keep them current after that,
+        call sync or let a Refresher do it.
+
+        :param lazy: Only fetch the lists. Each list fetches its own tasks
+                     the first time they are needed, see prefetch.
+        :type lazy: bool
+        :param prefetch: With lazy, titles of lists to fetch the tasks of
+                         right away, in one batch.
+        :type prefetch: list or None
         '''
 
-        # delete any currently stored lists
-        self.lists = []
+        if lazy:
+            self.load_lists(None, self.send_request(api.calls.get_lists()))
+            if prefetch:
+                self.prefetch(prefetch)
+            return
+
+        tasks, lists = self._fetch_all()
+        self.load_lists(tasks, lists)
+        self._fetched = (tasks, lists)
+
+    def _load_tasks(self, task_list):
+        '''Fetch the task dicts of a lazily loaded TaskList.'''
+
+        return self.send_request(api.calls.get_list_tasks(task_list.id))
 
+    @writes
+    def prefetch(self, list_titles=None):
+        '''Fetch the tasks of lazily loaded lists in one batch.
+
+        The /batch calls are sent in parallel when there are many lists,
+        see APIClient.send_requests.
+
+        :param list_titles: Lists to fetch, defaults to all of them.
+        :type list_titles: list or None
+        '''
+
+        if list_titles is None:
+            task_lists = self.lists
+        else:
+            task_lists = [l for title in list_titles
+                          for l in self.lists_with_title(title)]
+        task_lists = [l for l in task_lists if not l.loaded]
+
+        requests = [api.calls.get_list_tasks(l.id) for l in task_lists]
+        results = self.send_requests(requests, sequential=False)
+        for task_list, tasks in zip(task_lists, results):
+            task_list.tasks = [Task(t, parent_list=task_list) for t in tasks]
+
+    def _fetch_all(self):
+        '''Get every task and list dict.
+
+        With a response_cache they are fetched one by one instead of in a
+        batch, so whichever hasn't changed costs a 304 and comes back as
+        the very same object as last time.
+
+        :returns: tuple -- (task dicts, list dicts)
+        '''
+
+        if self.response_cache is not None:
+            return (self.send_request(api.calls.get_all_tasks()),
+                    self.send_request(api.calls.get_lists()))
         tasks, lists = self.send_requests([api.calls.get_all_tasks(),
                                           api.calls.get_lists()])
+        return tasks, lists
+
+    def _unchanged(self, tasks, lists):
+        '''Whether a fetch returned the cached responses of the last one.'''
+
+        return (self._fetched is not None and tasks is self._fetched[0] and
+                lists is self._fetched[1])
+
+    def iter_tasks(self, per_page=None, timeout=30):
+        '''Yield every task of the account, without keeping any of them.
+
+        Tasks are decoded from /me/tasks as it is downloaded, so memory use
+        stays flat however big the account is, e.g. for exports. Each one's
+        parent_list is the current TaskList with its list_id (None if there
+        is none), but it isn't added to that list.
+
+        :param per_page: Fetch the tasks in pages of this many, one request
+                         per page, until a page comes back short, too long
+                         or starting with a task already seen. None
+                         fetches them in a single response.
+        :type per_page: int or None
+        :param timeout: Timeout duration of each request in seconds.
+        :type timeout: int
+        :yields: Task
+        '''
+
+        parents = dict((l.id, l) for l in self.lists)
+        first_ids = set()  # to notice a server repeating its pages
+        page = 1
+        while True:
+            count = 0
+            request = api.calls.get_all_tasks(page, per_page)
+            for info in self.stream_request(request, timeout):
+                if count == 0:
+                    if info.get("id") in first_ids:
+                        return
+                    first_ids.add(info.get("id"))
+                count += 1
+                yield Task(info, parent_list=parents.get(info.get("list_id")))
+            # a page longer than asked for means paging was ignored
+            if per_page is None or count != per_page:
+                return
+            page += 1
+
+    @writes
+    def load_lists(self, tasks, lists):
+        '''Build the lists from task and list dicts as returned by the API.
+
+        :param tasks: Task information dicts, as from /me/tasks, or None
+                      to load each list's tasks when first needed.
+        :type tasks: list or None
+        :param lists: List information dicts, as from /me/lists.
+        :type lists: list
+        '''
+
+        self._fetched = None
+        # delete any currently stored lists
+        self.lists = []
 
         # make inbox list
         inbox_info = {"title": "inbox", "id": "inbox", "created_on": None,
                       "updated_on": None}
-        inbox = TaskList(inbox_info)
-        inbox_tasks = [Task(t, parent_list=inbox) for t in tasks
-                       if t["list_id"] == "inbox"]
-        inbox.tasks = inbox_tasks
-        self.lists.append(inbox)
+        self.lists.append(TaskList(inbox_info))
+        self.lists.extend(TaskList(info=list_info) for list_info in lists)
+
+        self.orphans = TaskList(dict(ORPHANS_INFO))
+        if tasks is None:
+            for task_list in self.lists:
+                task_list.lazy_load(self._load_tasks)
+            return
+
+        buckets, orphans = group_tasks(tasks, [l.id for l in self.lists])
+        for task_list in self.lists:
+            task_list.tasks = [Task(t, parent_list=task_list)
+                               for t in buckets[task_list.id]]
+        self._index_task_ids()
+
+        self.orphans.tasks = [Task(t, parent_list=self.orphans)
+                              for t in orphans]
+
+    def dump_lists(self):
+        '''The inverse of load_lists.
+
+        :returns: tuple -- (task dicts, list dicts)
+        '''
+
+        tasks = [task.info for l in self.lists + [self.orphans]
+                 for task in l.tasks]
+        lists = [l.info for l in self.lists if l.id != "inbox"]
+        return tasks, lists
+
+    def sync(self):
+        '''Bring the lists up to date without rebuilding them.
+
+        Unlike update_lists, the existing TaskList and Task objects are
+        kept and only the ones whose revision changed are patched in place.
+        If nothing has been loaded yet this falls back to update_lists.
+
+        :returns: tuple -- (changed TaskLists, changed Tasks)
+        '''
+
+        if not self.lists:
+            self.update_lists()
+            return (list(self.lists),
+                    [task for l in self.lists for task in l.tasks])
+
+        if self.queue is not None:  # so the server has our changes
+            self.flush()
+        tasks, lists = self._fetch_all()
+        if self._unchanged(tasks, lists):
+            return [], []
+        changes = self.merge_lists(tasks, lists)
+        self._fetched = (tasks, lists)
+        return changes
 
+    @writes
+    def merge_lists(self, tasks, lists):
+        '''Patch the current lists to match task and list dicts from the API.
+
+        This is the part of sync that doesn't talk to the server.
+
+        :returns: tuple -- (changed TaskLists, changed Tasks)
+        '''
+
+        self._fetched = None
+        changed_lists = []
+        changed_tasks = []
+
+        known_lists = dict((l.id, l) for l in self.lists)
+        # lists added in write-behind mode aren't on the server yet
+        current_lists = [l for l in self.lists
+                         if l.id == "inbox" or l.id is None]
         for list_info in lists:
-            new_list = TaskList(info=list_info)
-            new_tasks = [Task(t, parent_list=new_list) for t in tasks
-                         if t["list_id"] == list_info["id"]]
-            new_list.tasks = new_tasks
-            self.lists.append(new_list)
+            task_list = known_lists.get(list_info["id"])
+            if task_list is None:
+                task_list = TaskList(info=list_info)
+                changed_lists.append(task_list)
+            elif is_changed(task_list.info, list_info):
+                task_list.info = list_info
+                changed_lists.append(task_list)
+            current_lists.append(task_list)
+
+        # lists that disappeared on the server
+        current_ids = set(id(l) for l in current_lists)
+        changed_lists.extend(l for l in self.lists
+                             if id(l) not in current_ids)
+        self.lists = current_lists  # also resets the list indexes
+
+        for task_list in self.lists:
+            if not task_list.loaded:  # /me/tasks has its tasks anyway
+                task_list.tasks = []
+
+        parents = dict((l.id, l) for l in self.lists)
+        # task id: (Task, the TaskList currently holding it)
+        known_tasks = dict((task.id, (task, l))
+                           for l in self.lists + [self.orphans]
+                           for task in l.tasks if task.id is not None)
+        for info in tasks:
+            parent = parents.get(info.get("list_id"), self.orphans)
+            task, owner = known_tasks.pop(info["id"], (None, None))
+            if task is None:
+                task = Task(info, parent_list=parent)
+                parent.add_task(task)
+            elif owner is not parent:
+                owner.remove_task(task)
+                task.parent_list = parent
+                task.info = info
+                parent.add_task(task)
+            elif is_changed(task.info, info):
+                task.info = info
+            else:
+                continue
+            changed_tasks.append(task)
+
+        # whatever is left was deleted on the server
+        for task, owner in known_tasks.values():
+            owner.remove_task(task)
+            changed_tasks.append(task)
+
+        self._index_task_ids()
+        return changed_lists, changed_tasks
+
+    def _index_task_ids(self):
+        self._task_ids = dict((task.id, task) for l in self.lists
+                              for task in l.tasks if task.id is not None)
 
     def list_with_title(self, list_title):
         '''Return a TaskList with the given title.'''
 
-        lists = self.lists_with_title(list_title)
-        if len(lists) >= 1:
-            return lists[0]
-        else:
-            return None
+        return self._get_indexes()[0].first(list_title)
 
     def lists_with_title(self, list_title):
         '''Return all TaskLists with the given title.'''
 
-        return [list for list in self.lists if list.title == list_title]
+        return self._get_indexes()[0].get(list_title)
+
+    def list_with_id(self, list_id):
+        '''Return the TaskList with the given ID, or None.'''
+
+        return self._get_indexes()[1].first(list_id)
 
     def tasks_for_list(self, list_title):
         '''Get all tasks belonging to a list.'''
@@ -86,26 +477,68 @@ class Wunderlist(api.APIClient):
         _list = self.list_with_title(list_title)
         return _list.task_with_title(task_title)
 
+    def task_with_id(self, task_id):
+        '''Return the Task with the given ID from any list, or None.
+
+        Tasks are looked up by ID across all lists at once. Ones that
+        reached a list some other way (lazy loading, TaskList.add_task...)
+        are found by asking each list, and remembered.
+        '''
+
+        if self._reading():  # the frozen lists have their own Tasks
+            return self._search_task_id(task_id)
+        task = self._task_ids.get(task_id)
+        if (task is not None and task.parent_list is not None and
+                task.parent_list.task_with_id(task_id) is task):
+            return task
+        task = self._search_task_id(task_id)
+        if task is not None:
+            self._task_ids[task_id] = task
+        return task
+
+    def _search_task_id(self, task_id):
+        for task_list in self.lists:
+            task = task_list.task_with_id(task_id)
+            if task is not None:
+                return task
+        return None
+
     def id_for_task(self, task_title, list_title):
         '''Return the ID for a task in a list.'''
 
-        _list = self.list_with_title(list_title)
-        return _list.task_with_title(task_title)["id"]
+        return self.get_task(task_title, list_title)["id"]
+
+    def find_tasks(self, **conditions):
+        '''Find Tasks in every list matching every given condition.
+
+        All lists are searched in one batched pass, e.g.
+        find_tasks(due_before=date, completed=False, starred=True).
+        See TaskList.find_tasks for the conditions.
+        '''
+
+        columns = TaskColumns.join(l._get_columns() for l in self.lists)
+        return query.find_tasks(columns, **conditions)
+
+    def tasks_due_between(self, start, end):
+        '''Return all Tasks due from start to end, both included.'''
+
+        tasks = [l.tasks_due_between(start, end) for l in self.lists]
+        tasks = itertools.chain.from_iterable(tasks)  # no flatten in python
+        return list(tasks)
 
     def tasks_due_before(self, date):
         '''Return a list of tasks due before date'''
 
         tasks = [l.tasks_due_before(date) for l in self.lists]
-        tasks = itertools.chain.from_iterable(tasks)  # no flatten in python
+        tasks = itertools.chain.from_iterable(tasks)
         return list(tasks)
 
     def tasks_due_on(self, date):
         '''Return all Tasks due on the given date.'''
 
-        tasks = [l.tasks_due_on(date) for l in self.lists]
-        tasks = itertools.chain.from_iterable(tasks)
-        return list(tasks)
+        return self.tasks_due_between(date, date)
 
+    @writes
     def add_task(self, title, list_title="inbox", note=None, due_date=None,
                  starred=False, **kwargs):
         '''Create a new task.
@@ -126,58 +559,266 @@ class Wunderlist(api.APIClient):
         if "list" in kwargs:
             list_title = kwargs["list"]
 
-        list_id = self.id_for_list(list_title)
-        add_task = api.calls.add_task(title, list_id, due_date=due_date,
-                                      starred=starred)
-        result = self.send_request(add_task)
-
-        # update internal state
         parent_list = self.list_with_title(list_title)
-        new_task = Task(result, parent_list=parent_list)
-        parent_list.add_task(new_task)
-
-        if note:
-            self.send_request(api.calls.set_note_for_task(note, result["id"]))
-
+        self._require_id(parent_list)
+        add_task = api.calls.add_task(title, parent_list.id,
+                                      due_date=due_date, starred=starred)
+        new_task = Task(dict(add_task.data, id=None), parent_list=parent_list)
+
+        def added(result):
+            # update internal state
+            new_task.info = result
+            if self.queue is None:  # not added optimistically
+                parent_list.add_task(new_task)
+            self._task_ids[new_task.id] = new_task
+            if note:
+                self._submit(api.calls.set_note_for_task(note, result["id"]),
+                             self._set_info(new_task))
+
+        self._submit(add_task, added,
+                     optimistic=lambda: parent_list.add_task(new_task),
+                     rollback=lambda: new_task.parent_list.remove_task(
+                         new_task))
+
+    @writes
     def complete_task(self, task_title, list_title="inbox"):
         '''Complete a task with the given title in the given list.'''
 
-        task_id = self.id_for_task(task_title, list_title)
-        new_task = self.send_request(api.calls.complete_task(task_id))
-        self.get_task(task_title, list_title).info = new_task
+        task = self.get_task(task_title, list_title)
+        self._require_id(task)
+        request = api.calls.complete_task(task.id)
+        self._submit(request, self._set_info(task),
+                     optimistic=self._patch_info(task, request),
+                     rollback=self._restore_info(task))
 
+    @writes
     def update_task_due_date(self, task_title, due_date, recurrence_count=1, list_title="inbox"):
         '''Updates a task with the given title in the given list. Sets the due_date (iso_format) and recurrence count.'''
 
-        task_id = self.id_for_task(task_title, list_title)
-        new_task = self.send_request(api.calls.set_task_due_date(task_id, due_date, recurrence_count))
-        self.get_task(task_title, list_title).info = new_task
+        task = self.get_task(task_title, list_title)
+        self._require_id(task)
+        request = api.calls.set_task_due_date(task.id, due_date,
+                                              recurrence_count)
+        self._submit(request, self._set_info(task),
+                     optimistic=self._patch_info(task, request),
+                     rollback=self._restore_info(task))
 
+    @writes
     def update_task_title(self, task_title, new_title, list_title="inbox"):
         '''Updates a task with the given title in the given list, and renames it to new_title'''
 
-        task_id = self.id_for_task(task_title, list_title)
-        new_task = self.send_request(api.calls.set_title_for_task(task_id, new_title))
-        self.get_task(task_title, list_title).info = new_task
+        task = self.get_task(task_title, list_title)
+        self._require_id(task)
+        request = api.calls.set_title_for_task(task.id, new_title)
+        self._submit(request, self._set_info(task),
+                     optimistic=self._patch_info(task, request),
+                     rollback=self._restore_info(task))
 
+    @writes
     def delete_task(self, task_title, list_title="inbox"):
         '''Delete a task'''
 
-        task_id = self.id_for_task(task_title, list_title)
-        self.send_request(api.calls.delete_task(task_id))
+        _list = self.list_with_title(list_title)
+        task = _list.task_with_title(task_title)
+        self._require_id(task)
+
+        def remove():
+            _list.remove_task(task)
+            self._task_ids.pop(task.id, None)
 
-        task_to_remove = self.get_task(task_title, list_title)
-        self.list_with_title(list_title).remove_task(task_to_remove)
+        def deleted(result):
+            if self.queue is None:  # not removed optimistically
+                remove()
 
+        self._submit(api.calls.delete_task(task.id), deleted,
+                     optimistic=remove,
+                     rollback=lambda: _list.add_task(task))
+
+    @writes
     def add_list(self, list_title):
         '''Create a new list'''
 
-        new = self.send_request(api.calls.add_list(list_title))
-        new_list = TaskList(info=new)
-        self.lists.append(new_list)
+        new_list = TaskList(info={"title": list_title, "id": None})
+
+        def added(result):
+            new_list.info = result
+            if self.queue is None:  # not added optimistically
+                self._append_list(new_list)
+            else:
+                self._indexes = None  # its id changed
+
+        self._submit(api.calls.add_list(list_title), added,
+                     optimistic=lambda: self._append_list(new_list),
+                     rollback=lambda: self._remove_list(new_list))
 
+    @writes
     def delete_list(self, list_title):
         '''Delete a list.'''
 
-        self.send_request(api.calls.delete_list(self.id_for_list(list_title)))
-        self.lists.remove(self.list_with_title(list_title))
+        _list = self.list_with_title(list_title)
+        self._require_id(_list)
+
+        def deleted(result):
+            if self.queue is None:  # not removed optimistically
+                self._remove_list(_list)
+
+        self._submit(api.calls.delete_list(_list.id), deleted,
+                     optimistic=lambda: self._remove_list(_list),
+                     rollback=lambda: self._append_list(_list))
+
+    @writes
+    def enable_write_behind(self, max_size=100, max_delay=5.0,
+                            on_flush_error=None):
+        '''Queue changes and send them in batches instead of one by one.
+
+        add_task, complete_task, update_task_*, delete_task, add_list
+        and delete_list then change the lists right away and queue their
+        request. The queue is sent once it holds max_size requests or its
+        oldest request is max_delay seconds old (from a timer thread if
+        nothing else sends it first), and whenever flush or sync is
+        called. A change whose request fails is undone. Call flush when
+        you're done.
+
+        :param max_size: See MutationQueue.
+        :type max_size: int
+        :param max_delay: See MutationQueue.
+        :type max_delay: float
+        :param on_flush_error: Called with the exception when the timer
+                               thread's flush fails.
+        :type on_flush_error: callable or None
+        '''
+
+        if self.queue is None:
+            self.queue = MutationQueue(max_size, max_delay)
+        self.on_flush_error = on_flush_error
+
+    @writes
+    def disable_write_behind(self):
+        '''Flush the queue and go back to sending changes immediately.'''
+
+        self.flush()
+        self.queue = None
+
+    @writes
+    def flush(self):
+        '''Send every queued change in as few batches as possible.
+
+        Responses are applied to the lists as they arrive. Requests queued
+        by those responses (e.g. a new task's note) are sent too. The
+        changes of the requests that failed are undone.
+
+        :raises: Exception with the failed BatchResults, after everything
+                 else has been applied.
+        '''
+
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        failures = []
+        while self.queue is not None and len(self.queue) > 0:
+            pending = self.queue.take()
+            results = self.stream_requests([p[0] for p in pending])
+            for (request, callback, rollback), result in zip(pending,
+                                                             results):
+                if result.error is not None:
+                    failures.append(result)
+                    if rollback is not None:
+                        rollback()
+                elif callback is not None:
+                    callback(result.body)
+        if failures:
+            raise Exception(failures)
+
+    def _flush_later(self):
+        '''Flush from the timer thread once the queue is max_delay old.'''
+
+        try:
+            self.flush()
+        except Exception as e:
+            if self.on_flush_error is not None:
+                self.on_flush_error(e)
+
+    def _submit(self, request, callback=None, optimistic=None,
+                rollback=None):
+        '''Send a request now, or queue it in write-behind mode.
+
+        :param callback: Called with the server's response.
+        :type callback: callable or None
+        :param optimistic: Called right away if the request is queued,
+                           to apply the change before the server has it.
+        :type optimistic: callable or None
+        :param rollback: Called if a queued request fails, to undo the
+                         change made before it was sent.
+        :type rollback: callable or None
+        '''
+
+        if self.queue is None:
+            result = self.send_request(request)
+            if callback is not None:
+                callback(result)
+            return
+
+        if optimistic is not None:
+            optimistic()
+        self.queue.append(request, callback, rollback)
+        if self.queue.is_due():
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.queue.max_delay,
+                                                self._flush_later)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _require_id(self, item):
+        '''Flush if item was created in write-behind mode and hasn't got its
+        ID from the server yet.'''
+
+        if item.id is None and self.queue is not None and len(self.queue):
+            self.flush()
+
+    @staticmethod
+    def _set_info(task):
+        '''Callback replacing a Task's info with the server's response.'''
+
+        def set_info(result):
+            task.info = result
+        return set_info
+
+    @staticmethod
+    def _restore_info(task):
+        '''Rollback putting back a Task's info as it is now.'''
+
+        info = task.info
+
+        def restore_info():
+            task.info = info
+        return restore_info
+
+    @staticmethod
+    def _patch_info(task, request):
+        '''Optimistic update copying a request's fields into a Task.'''
+
+        def patch_info():
+            task.info = dict(task.info, **request.data)
+        return patch_info
+
+    def _append_list(self, new_list):
+        '''Add a TaskList to self.lists and the indexes.'''
+
+        indexes = self._get_indexes()
+        self.lists.append(new_list)
+        for index in indexes:
+            index.add(new_list)
+
+    def _remove_list(self, _list):
+        '''Remove a TaskList from self.lists and the indexes.'''
+
+        indexes = self._get_indexes()
+        # TaskLists compare equal as dicts, so match on identity
+        self.lists[:] = [l for l in self.lists if l is not _list]
+        for index in indexes:
+            index.remove(_list)
+        if _list.loaded:
+            for task in _list.tasks:
+                self._task_ids.pop(task.id, None)